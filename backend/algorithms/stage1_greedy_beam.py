@@ -3,15 +3,133 @@ Stage 1: Greedy + Beam Search 快速排班
 使用單一策略：不可值班日最多的人先排、假日優先
 透過 Beam Search 探索不同組合，產生 Top-5 方案
 """
-import copy
+import heapq
+import math
 import random
-import streamlit as st
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from typing import List, Dict, Tuple, Optional, Callable, Set
-from collections import defaultdict
 import numpy as np
-from backend.models import Doctor, ScheduleSlot, ScheduleConstraints, SchedulingState
+
+try:
+    from numba import njit
+except ImportError:
+    # 未安裝 numba 時退回純 Python 執行（結果相同，只是較慢）
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+from backend.models import Doctor, ScheduleSlot, ScheduleConstraints, SchedulingState, clone_schedule
 from backend.utils.date_parser import normalize_dates_to_full_format
 
+# 配額矩陣的欄位索引
+QUOTA_WEEKDAY = 0
+QUOTA_HOLIDAY = 1
+
+
+@njit(cache=True)
+def _schedule_stats(att_ids, res_ids, holiday_mask, preferred, role_codes,
+                    num_doctors, max_consecutive_days):
+    """單次掃描排班陣列，一併計算計分所需的統計
+    
+    日期依序排列，-1 表示空格；preferred 為 (醫師數, 日期數) 的優先值班日遮罩，
+    role_codes 為各醫師角色（0 主治、1 總醫師），只有本角色的優先值班日才算滿足。
+    
+    回傳 (已填格數, 已使用配額, 優先值班日滿足數, 假日已填格數, 連續值班懲罰)
+    """
+    used_quota = np.zeros((num_doctors, 2), np.int32)
+    max_runs = np.zeros(num_doctors, np.int32)
+    current = np.zeros(num_doctors, np.int32)
+    last_day = np.full(num_doctors, -2, np.int32)
+    filled_count = 0
+    preference_satisfied = 0
+    holiday_filled = 0
+    
+    for i in range(att_ids.shape[0]):
+        col = 1 if holiday_mask[i] else 0
+        for k in range(2):
+            d = att_ids[i] if k == 0 else res_ids[i]
+            if d < 0:
+                continue
+            filled_count += 1
+            holiday_filled += col
+            used_quota[d, col] += 1
+            if preferred[d, i] and role_codes[d] == k:
+                preference_satisfied += 1
+            
+            # 連續值班：同一天兼任兩角色只算一天
+            if k == 1 and d == att_ids[i]:
+                continue
+            if last_day[d] == i - 1:
+                current[d] += 1
+            else:
+                current[d] = 1
+            last_day[d] = i
+            if current[d] > max_runs[d]:
+                max_runs[d] = current[d]
+    
+    # 連續值班懲罰：超過上限的天數 × 50
+    excess_days = 0
+    for d in range(num_doctors):
+        if max_runs[d] > max_consecutive_days:
+            excess_days += max_runs[d] - max_consecutive_days
+    
+    return filled_count, used_quota, preference_satisfied, holiday_filled, float(excess_days * 50)
+
+
+@njit(cache=True)
+def _consecutive_if_assigned(att_ids, res_ids, doctor_idx, date_idx, limit):
+    """以醫師編號陣列檢查如果在 date_idx 分配 doctor_idx 會造成連續幾天
+    
+    呼叫端只需判斷是否超過 limit，計數一超過即停止掃描（此時回傳 limit + 1）
+    """
+    consecutive = 1
+    
+    # 向前檢查
+    i = date_idx - 1
+    while i >= 0 and consecutive <= limit and \
+            (att_ids[i] == doctor_idx or res_ids[i] == doctor_idx):
+        consecutive += 1
+        i -= 1
+    
+    # 向後檢查
+    i = date_idx + 1
+    while i < att_ids.shape[0] and consecutive <= limit and \
+            (att_ids[i] == doctor_idx or res_ids[i] == doctor_idx):
+        consecutive += 1
+        i += 1
+    
+    return consecutive
+
+
+@njit(cache=True)
+def _mask_consecutive_violations(att_ids, res_ids, doctor_ids, mask, date_idx, limit):
+    """就地清除 mask 中在 date_idx 分配後連續值班會超過 limit 的醫師
+    
+    doctor_ids[i] 為 mask[i] 對應的醫師編號；只檢查仍為 True 的項目，
+    整個迴圈在同一次呼叫內完成，不必逐位醫師往返 Python
+    """
+    for i in np.nonzero(mask)[0]:
+        if _consecutive_if_assigned(att_ids, res_ids, doctor_ids[i], date_idx, limit) > limit:
+            mask[i] = False
+
+
+# 平行 Beam Search 的子行程狀態：排班器於 initializer 載入一次，避免每個任務重複序列化
+_worker_scheduler = None
+
+
+def _init_beam_worker(scheduler: 'Stage1Scheduler'):
+    """子行程初始化：保存排班器（醫師資料、日期索引等靜態結構）"""
+    global _worker_scheduler
+    _worker_scheduler = scheduler
+
+
+def _expand_beam_state(state: SchedulingState, date_str: str, role: str) -> List[SchedulingState]:
+    """子行程任務：展開單一父狀態"""
+    return _worker_scheduler._expand_state(state, date_str, role)
+
 class Stage1Scheduler:
     """Stage 1: Greedy + Beam Search 排班器"""
     
@@ -22,12 +140,43 @@ class Stage1Scheduler:
         self.weekdays = weekdays
         self.holidays = holidays
         
+        # 日誌回調（由前端設定，演算法本身不依賴 UI 套件）
+        self.log_callback: Optional[Callable[[str, str], None]] = None
+        
+        # 預先建立日期查詢結構（避免在熱路徑上反覆掃描 list 或排序）
+        self.holiday_set = frozenset(holidays)
+        self.weekday_set = frozenset(weekdays)
+        self.sorted_dates = sorted(self.weekday_set | self.holiday_set)
+        self.date_index = {d: i for i, d in enumerate(self.sorted_dates)}
+        self.schedule_dates = list(dict.fromkeys(weekdays + holidays))  # 排班表字典的鍵順序
+        self.fill_order = holidays + weekdays  # 填班與收集空格的順序（假日優先）
+        
         # 分類醫師
         self.attending_doctors = [d for d in doctors if d.role == "主治"]
         self.resident_doctors = [d for d in doctors if d.role == "總醫師"]
         
         # 建立醫師索引
         self.doctor_map = {d.name: d for d in doctors}
+        self.doctor_index = {d.name: i for i, d in enumerate(doctors)}
+        
+        # 配額上限矩陣 (醫師數, 2)：第 0 欄平日、第 1 欄假日
+        self.quota_limits = np.array(
+            [[d.weekday_quota, d.holiday_quota] for d in doctors], dtype=np.int32
+        ).reshape(-1, 2)
+        self.quota_divisors = np.maximum(self.quota_limits, 1).astype(np.float64)
+        
+        # 配額使用率以整數單位表示（使用率 × usage_scale），均衡度的總和與平方和可精確增量更新，
+        # 不論以何種順序填入，相同配額矩陣都得到完全相同的分數
+        divisors = np.maximum(self.quota_limits, 1).tolist()
+        self.usage_scale = 2 * math.lcm(*(d for row in divisors for d in row))
+        self.usage_weights = [[self.usage_scale // (2 * d) for d in row] for row in divisors]
+        
+        # 各日期（依 sorted_dates 順序）計入的配額欄位與是否為假日
+        self.date_quota_cols = np.array(
+            [QUOTA_HOLIDAY if d in self.holiday_set else QUOTA_WEEKDAY for d in self.sorted_dates],
+            dtype=np.intp
+        )
+        self.holiday_mask = self.date_quota_cols == QUOTA_HOLIDAY
         
         # 從日期格式推斷年月
         self.year, self.month = self._infer_year_month()
@@ -35,7 +184,7 @@ class Stage1Scheduler:
         # 統一所有日期格式
         self.doctor_unavailable = {}
         self.doctor_preferred = {}
-        self.preferred_assignments = defaultdict(lambda: {'主治': [], '總醫師': []})
+        self.preferred_assignments = {}
         
         for doctor in self.doctors:
             # 使用 date_parser 轉換不可值班日
@@ -58,19 +207,151 @@ class Stage1Scheduler:
                 converted = self._convert_to_schedule_format(date_str)
                 if converted:
                     preferred_converted.add(converted)
-                    self.preferred_assignments[converted][doctor.role].append(doctor.name)
+                    self.preferred_assignments.setdefault(
+                        converted, {'主治': [], '總醫師': []}
+                    )[doctor.role].append(doctor.name)
             self.doctor_preferred[doctor.name] = preferred_converted
         
+        # 優先值班日總數（計分用，整個排班期間固定）
+        self.preference_total = sum(
+            len(self.doctor_preferred[d.name]) for d in self.doctors
+        )
+        
+        # 本月專用的計分函式
+        self._score_state = self._build_score_function()
+        
+        # 各醫師的不可值班日、優先值班日遮罩 (醫師數, 日期數)，第 j 欄對應 sorted_dates[j]
+        self.unavailable_matrix = self._dates_to_matrix(self.doctor_unavailable)
+        self.preferred_matrix = self._dates_to_matrix(self.doctor_preferred)
+        self.role_codes = np.array(
+            [0 if d.role == "主治" else 1 for d in doctors], dtype=np.int8
+        )
+        
+        # 他人的優先值班日：該日有同角色醫師優先值班時，其餘醫師皆不可占用
+        self.reserved_matrix = {}
+        for code, role in enumerate(("主治", "總醫師")):
+            role_preferred = self.preferred_matrix & (self.role_codes == code)[:, None]
+            self.reserved_matrix[role] = role_preferred.any(axis=0) & ~role_preferred
+        
         # 計算醫師的不可值班日數量（用於排序）
+        self.unavailable_counts = self.unavailable_matrix.sum(axis=1)
         self.doctor_unavailable_count = {
-            d.name: len(self.doctor_unavailable[d.name]) for d in self.doctors
+            d.name: int(self.unavailable_counts[self.doctor_index[d.name]]) for d in self.doctors
+        }
+        
+        # 優先值班日格位（假日優先）：(日期, 角色, 偏好醫師, 依不可值班日數由多到少排序的偏好醫師)
+        self.preferred_slots = [
+            (date_str, role, names,
+             sorted(names, key=lambda d: self.doctor_unavailable_count[d], reverse=True))
+            for date_str in self.fill_order if date_str in self.preferred_assignments
+            for role, names in self.preferred_assignments[date_str].items() if names
+        ]
+        
+        # 以 Python int 位元遮罩表示各醫師的日期限制（第 i 位對應 sorted_dates[i]）
+        self.unavailable_bits = {
+            d.name: self._mask_to_bits(self.unavailable_matrix[self.doctor_index[d.name]])
+            for d in self.doctors
+        }
+        self.preferred_bits = {
+            d.name: self._mask_to_bits(self.preferred_matrix[self.doctor_index[d.name]])
+            for d in self.doctors
+        }
+        self.reserved_bits = {
+            role: {
+                d.name: self._mask_to_bits(reserved[self.doctor_index[d.name]])
+                for d in self.doctors
+            }
+            for role, reserved in self.reserved_matrix.items()
+        }
+        # 各角色的靜態限制合併為一個遮罩（不可值班日 | 他人優先值班日），可排者只需一次位元檢查
+        self.blocked_bits = {
+            role: {
+                name: self.unavailable_bits[name] | bits
+                for name, bits in role_bits.items()
+            }
+            for role, role_bits in self.reserved_bits.items()
+        }
+        
+        # 各角色醫師的向量化屬性（Beam Search 候選評估用）
+        self.role_arrays = {
+            role: self._build_role_arrays(role, group)
+            for role, group in (("主治", self.attending_doctors),
+                                ("總醫師", self.resident_doctors))
         }
         
         # 診斷資訊
         self.diagnostic_info = {
             'perfect_solution': False,
             'violations': [],
-            'beam_search_iterations': 0
+            'beam_search_iterations': 0,
+            'pruned_expansions': 0,
+            'pruned_parents': 0
+        }
+        
+        # 貪婪建構中排班表的各醫師值班位元遮罩（排班表, {醫師: 位元遮罩}），由 _rebuild_run_state 建立
+        self._run_state = None
+        
+        # 初始解隨機性統一使用 NumPy 亂數產生器；每次貪婪初始化改由 random 模組取種子，random.seed 仍可重現結果
+        self._rng = np.random.default_rng()
+        
+        # 本月專用的硬約束檢查函式
+        self._check_assign = self._build_assign_checker()
+    
+    def __getstate__(self):
+        """序列化時略過日誌回調與計分、檢查閉包（平行展開時排班器會傳給子行程）"""
+        state = self.__dict__.copy()
+        state['log_callback'] = None
+        state['_run_state'] = None
+        del state['_score_state']  # 閉包無法序列化，還原時重建
+        del state['_check_assign']
+        return state
+    
+    def __setstate__(self, state):
+        """還原序列化的排班器並重建計分與檢查函式"""
+        self.__dict__.update(state)
+        self._score_state = self._build_score_function()
+        self._check_assign = self._build_assign_checker()
+    
+    def set_log_callback(self, callback: Callable[[str, str], None]):
+        """設定日誌回調函數"""
+        self.log_callback = callback
+    
+    def _log(self, message: str, level: str = "info"):
+        """記錄日誌"""
+        if self.log_callback:
+            self.log_callback(message, level)
+    
+    def _dates_to_matrix(self, doctor_dates: Dict[str, Set[str]]) -> np.ndarray:
+        """將各醫師的日期集合轉為 (醫師數, 日期數) 的布林遮罩"""
+        matrix = np.zeros((len(self.doctors), len(self.sorted_dates)), dtype=np.bool_)
+        for name, dates in doctor_dates.items():
+            matrix[self.doctor_index[name], [self.date_index[d] for d in dates]] = True
+        return matrix
+    
+    def _mask_to_bits(self, mask: np.ndarray) -> int:
+        """將一列日期遮罩編碼為位元遮罩"""
+        return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+    
+    def _build_role_arrays(self, role: str, group: List[Doctor]) -> Dict:
+        """建立同角色醫師對齊的 NumPy 陣列：禁排遮罩、優先值班日、排序權重與配額"""
+        names = [d.name for d in group]
+        index = np.array([self.doctor_index[name] for name in names], dtype=np.intp)
+        
+        # 不可值班日與他人的優先值班日皆視為禁排
+        blocked = self.unavailable_matrix[index] | self.reserved_matrix[role][index]
+        preferred = self.preferred_matrix[index]
+        
+        return {
+            'names': names,
+            'index': index,
+            'blocked': blocked,
+            'preferred': preferred,
+            'priority': self.unavailable_counts[index] * 100.0,
+            # 依不可值班日數由多到少的穩定排序（同數時維持醫師原始順序）
+            'unavailable_counts': self.unavailable_counts[index],
+            'by_unavailable': np.argsort(-self.unavailable_counts[index], kind='stable'),
+            'quota_limits': self.quota_limits[index],
+            'quota_divisors': self.quota_divisors[index],
         }
     
     def _infer_year_month(self) -> Tuple[int, int]:
@@ -104,197 +385,273 @@ class Stage1Scheduler:
             ]
             
             for fmt in possible_formats:
-                if fmt in self.weekdays or fmt in self.holidays:
+                if fmt in self.weekday_set or fmt in self.holiday_set:
                     return fmt
         
-        if date_yyyy_mm_dd in self.weekdays or date_yyyy_mm_dd in self.holidays:
+        if date_yyyy_mm_dd in self.weekday_set or date_yyyy_mm_dd in self.holiday_set:
             return date_yyyy_mm_dd
         
         return None
     
     def _can_assign(self, doctor_name: str, date_str: str, role: str,
-                   schedule: Dict, used_quota: Dict) -> Tuple[bool, str]:
-        """檢查是否可以分配醫師（嚴格檢查所有硬約束）"""
-        doctor = self.doctor_map[doctor_name]
-        
-        if date_str not in schedule:
-            return False, f"日期 {date_str} 不在排班表中"
-        
-        slot = schedule[date_str]
-        
-        # 硬約束1：同一日同一角色只能一人
-        if role == "主治" and slot.attending is not None:
-            return False, f"該日主治已有 {slot.attending}"
-        if role == "總醫師" and slot.resident is not None:
-            return False, f"該日總醫師已有 {slot.resident}"
-        
-        # 硬約束2：配額限制
-        is_holiday = date_str in self.holidays
-        quota_type = 'holiday' if is_holiday else 'weekday'
-        max_quota = doctor.holiday_quota if is_holiday else doctor.weekday_quota
-        current_used = used_quota.get(doctor_name, {}).get(quota_type, 0)
-        
-        if current_used >= max_quota:
-            return False, f"{doctor_name} 的{quota_type}配額已滿"
-        
-        # 硬約束3：不可值班日
-        if date_str in self.doctor_unavailable[doctor_name]:
-            return False, f"{date_str} 是 {doctor_name} 的不可值班日"
-        
-        # 硬約束4：優先值班日
-        if date_str in self.preferred_assignments:
-            preferred_list = self.preferred_assignments[date_str].get(role, [])
-            if preferred_list and doctor_name not in preferred_list:
+                   schedule: Dict, used_quota: np.ndarray) -> Tuple[bool, str]:
+        """檢查是否可以分配醫師（嚴格檢查所有硬約束，實作見 _build_assign_checker）"""
+        return self._check_assign(doctor_name, date_str, role, schedule, used_quota)
+    
+    def _build_assign_checker(self) -> Callable[[str, str, str, Dict, np.ndarray], Tuple[bool, str]]:
+        """產生本月專用的硬約束檢查函式
+        
+        醫師名單、配額、日期索引與連續值班上限在整個排班期間固定，先代入為區域常數，
+        逐一檢查候選時不必再查屬性。
+        由便宜且最常擋下的檢查先做，需掃描前後日期的連續值班檢查放最後
+        """
+        date_index = self.date_index
+        doctor_index = self.doctor_index
+        unavailable_bits = self.unavailable_bits
+        blocked_bits = self.blocked_bits
+        date_quota_cols = self.date_quota_cols
+        quota_limits = self.quota_limits
+        max_days = self.constraints.max_consecutive_days
+        check_consecutive = self._check_consecutive_if_assigned
+        
+        def can_assign(doctor_name: str, date_str: str, role: str,
+                       schedule: Dict, used_quota: np.ndarray) -> Tuple[bool, str]:
+            """檢查是否可以分配醫師"""
+            slot = schedule.get(date_str)
+            if slot is None:
+                return False, f"日期 {date_str} 不在排班表中"
+            
+            # 硬約束1：同一日同一角色只能一人
+            if role == "主治" and slot.attending is not None:
+                return False, f"該日主治已有 {slot.attending}"
+            if role == "總醫師" and slot.resident is not None:
+                return False, f"該日總醫師已有 {slot.resident}"
+            
+            date_idx = date_index[date_str]
+            
+            # 硬約束2、5 為靜態限制：先以合併遮罩一次判斷，命中時才區分原因
+            reserved = False
+            if (blocked_bits[role][doctor_name] >> date_idx) & 1:
+                # 硬約束2：不可值班日
+                if (unavailable_bits[doctor_name] >> date_idx) & 1:
+                    return False, f"{date_str} 是 {doctor_name} 的不可值班日"
+                reserved = True
+            
+            # 硬約束3：同日不能擔任兩個角色
+            if doctor_name == slot.attending or doctor_name == slot.resident:
+                return False, f"{doctor_name} 當日已擔任其他角色"
+            
+            # 硬約束4：配額限制（直接比對配額上限矩陣）
+            doctor_idx = doctor_index[doctor_name]
+            quota_col = date_quota_cols[date_idx]
+            if used_quota[doctor_idx, quota_col] >= quota_limits[doctor_idx, quota_col]:
+                quota_type = 'holiday' if quota_col == QUOTA_HOLIDAY else 'weekday'
+                return False, f"{doctor_name} 的{quota_type}配額已滿"
+            
+            # 硬約束5：優先值班日（保留原本的檢查順序，配額已滿時回報配額）
+            if reserved:
                 return False, f"{date_str} 是他人的優先值班日"
+            
+            # 硬約束6：連續值班限制
+            if check_consecutive(doctor_name, date_str, schedule, max_days) > max_days:
+                return False, f"會造成連續值班超過 {max_days} 天"
+            
+            return True, ""
         
-        # 硬約束5：連續值班限制
-        consecutive = self._check_consecutive_if_assigned(doctor_name, date_str, schedule)
-        if consecutive > self.constraints.max_consecutive_days:
-            return False, f"會造成連續值班 {consecutive} 天"
-        
-        # 同日不能擔任兩個角色
-        if doctor_name == slot.attending or doctor_name == slot.resident:
-            return False, f"{doctor_name} 當日已擔任其他角色"
-        
-        return True, ""
+        return can_assign
+    
+    def _rebuild_run_state(self, schedule: Dict):
+        """由排班表重建各醫師的值班位元遮罩，之後由 _assign_doctor 增量維護"""
+        duty_bits = dict.fromkeys(self.doctor_index, 0)
+        for date_str, slot in schedule.items():
+            bit = 1 << self.date_index[date_str]
+            for name in (slot.attending, slot.resident):
+                if name in duty_bits:
+                    duty_bits[name] |= bit
+        self._run_state = (schedule, duty_bits)
     
     def _check_consecutive_if_assigned(self, doctor_name: str, target_date: str,
-                                       schedule: Dict) -> int:
-        """檢查如果分配會造成連續幾天"""
-        sorted_dates = sorted(schedule.keys())
-        if target_date not in sorted_dates:
+                                       schedule: Dict, limit: Optional[int] = None) -> int:
+        """檢查如果分配會造成連續幾天
+        
+        給定 limit 時計數一超過 limit 即停止掃描（只需判斷是否超過上限時使用）
+        """
+        sorted_dates = self.sorted_dates
+        date_idx = self.date_index.get(target_date)
+        if date_idx is None:
             return 1
+        if limit is None:
+            limit = len(sorted_dates)
+        
+        # 貪婪建構中的排班表：以值班位元遮罩直接算出前後連續段長度
+        if self._run_state is not None and self._run_state[0] is schedule \
+           and doctor_name in self._run_state[1]:
+            bits = self._run_state[1][doctor_name]
+            after = bits >> (date_idx + 1)
+            after_run = (after ^ (after + 1)).bit_length() - 1
+            gaps = ~bits & ((1 << date_idx) - 1)
+            before_run = date_idx - gaps.bit_length()
+            return min(1 + before_run + after_run, limit + 1)
         
-        date_idx = sorted_dates.index(target_date)
         consecutive = 1
         
         # 向前檢查
-        for i in range(date_idx - 1, -1, -1):
+        i = date_idx - 1
+        while i >= 0 and consecutive <= limit:
             slot = schedule[sorted_dates[i]]
-            if doctor_name == slot.attending or doctor_name == slot.resident:
-                consecutive += 1
-            else:
+            if doctor_name != slot.attending and doctor_name != slot.resident:
                 break
+            consecutive += 1
+            i -= 1
         
         # 向後檢查
-        for i in range(date_idx + 1, len(sorted_dates)):
+        i = date_idx + 1
+        while i < len(sorted_dates) and consecutive <= limit:
             slot = schedule[sorted_dates[i]]
-            if doctor_name == slot.attending or doctor_name == slot.resident:
-                consecutive += 1
-            else:
+            if doctor_name != slot.attending and doctor_name != slot.resident:
                 break
+            consecutive += 1
+            i += 1
         
         return consecutive
     
     def _assign_doctor(self, schedule: Dict, date_str: str, role: str,
-                      doctor_name: str, used_quota: Dict) -> bool:
+                      doctor_name: str, used_quota: np.ndarray) -> bool:
         """安全地分配醫師"""
-        can_assign, reason = self._can_assign(doctor_name, date_str, role, schedule, used_quota)
+        can_assign, reason = self._check_assign(doctor_name, date_str, role, schedule, used_quota)
         
         if not can_assign:
             return False
         
-        is_holiday = date_str in self.holidays
-        quota_type = 'holiday' if is_holiday else 'weekday'
-        
+        self._place_doctor(schedule, date_str, role, doctor_name, used_quota)
+        return True
+    
+    def _place_doctor(self, schedule: Dict, date_str: str, role: str,
+                      doctor_name: str, used_quota: np.ndarray):
+        """寫入排班並更新配額（呼叫端須已確認符合所有硬約束）"""
         if role == "主治":
             schedule[date_str].attending = doctor_name
         else:
             schedule[date_str].resident = doctor_name
         
-        if doctor_name not in used_quota:
-            used_quota[doctor_name] = {'weekday': 0, 'holiday': 0}
-        used_quota[doctor_name][quota_type] += 1
+        date_idx = self.date_index[date_str]
+        quota_col = self.date_quota_cols[date_idx]
+        used_quota[self.doctor_index[doctor_name], quota_col] += 1
         
-        return True
+        if self._run_state is not None and self._run_state[0] is schedule:
+            self._run_state[1][doctor_name] |= 1 << date_idx
     
-    def run(self, beam_width: int = 5, progress_callback: Callable = None) -> List[SchedulingState]:
-        """執行排班"""
+    def run(self, beam_width: int = 5, progress_callback: Callable = None,
+            max_workers: Optional[int] = 1,
+            time_budget_s: Optional[float] = None) -> List[SchedulingState]:
+        """執行排班
+        
+        max_workers 大於 1（或為 None 使用全部 CPU）時，Beam Search 以多行程平行展開各父狀態
+        time_budget_s 有給定時改為逐步加寬束寬（1、2、4…至 beam_width），
+        預估下一輪會超時即不再加寬，並回傳目前為止最好的方案
+        """
         
         # Step 1: 嘗試產生完美解（完全滿足所有硬約束）
         perfect_solution = self._try_perfect_solution()
         
         if perfect_solution and self._is_complete(perfect_solution):
             # 如果找到完美解，直接返回
-            st.success("🎉 找到完美解！所有硬約束都被滿足，且無空格！")
+            self._log("🎉 找到完美解！所有硬約束都被滿足，且無空格！", "success")
             self.diagnostic_info['perfect_solution'] = True
             state = self._create_state(perfect_solution)
             return [state]  # 返回完美解
         
         # Step 2: 使用 Beam Search 探索不同組合
-        st.info("使用 Beam Search 探索最佳組合...")
+        self._log("使用 Beam Search 探索最佳組合...", "info")
         initial_states = self._greedy_initialization(beam_width)
         
         # Step 3: Beam Search 優化
-        final_states = self._beam_search_optimization(
-            initial_states, beam_width, progress_callback
-        )
+        if time_budget_s is None:
+            final_states = self._beam_search_optimization(
+                initial_states, beam_width, progress_callback, max_workers
+            )
+        else:
+            final_states = self._iterative_beam_search(
+                initial_states, beam_width, progress_callback, max_workers, time_budget_s
+            )
         
         # Step 4: 取 Top-5
         final_states.sort(key=lambda x: x.score, reverse=True)
         top_5 = final_states[:5]
         
         # 顯示結果
-        st.write("### 📊 Top-5 方案")
+        self._log("### 📊 Top-5 方案", "detail")
         for idx, state in enumerate(top_5):
-            st.write(f"**方案 {idx+1}**: 分數 {state.score:.2f}, 填充率 {state.fill_rate:.1%}")
+            self._log(f"**方案 {idx+1}**: 分數 {state.score:.2f}, 填充率 {state.fill_rate:.1%}", "detail")
         
         return top_5
     
+    def _iterative_beam_search(self, initial_states: List[SchedulingState], beam_width: int,
+                               progress_callback: Callable, max_workers: Optional[int],
+                               time_budget_s: float) -> List[SchedulingState]:
+        """逐步加寬束寬的 Beam Search：窄束很快得到可行解，時間允許再以較寬的束搜尋
+        
+        束寬加倍時工作量約加倍，因此以上一輪耗時的兩倍預估下一輪，預估會超過時間上限就不再開始；
+        每一輪也帶入截止時間，於步驟之間檢查，已開始的一輪不會拖過時限太久
+        """
+        widths = []
+        width = 1
+        while width < beam_width:
+            widths.append(width)
+            width *= 2
+        widths.append(beam_width)
+        
+        start_time = time.monotonic()
+        deadline = start_time + time_budget_s
+        best_states = {}  # 以排班內容去重，保留各輪找到的所有方案
+        last_elapsed = 0.0
+        
+        for k, width in enumerate(widths):
+            pass_start = time.monotonic()
+            if k > 0 and pass_start + 2 * last_elapsed > deadline:
+                self._log(f"⏱️ 時間不足以再加寬，停止於束寬 {widths[k - 1]}", "info")
+                break
+            
+            pass_callback = None
+            if progress_callback:
+                pass_callback = lambda p, k=k: progress_callback((k + p) / len(widths))
+            
+            for state in self._beam_search_optimization(
+                initial_states, width, pass_callback, max_workers, deadline=deadline
+            ):
+                key = (state.attending_ids.tobytes(), state.resident_ids.tobytes())
+                if key not in best_states or state.score > best_states[key].score:
+                    best_states[key] = state
+            
+            last_elapsed = time.monotonic() - pass_start
+        
+        if progress_callback:
+            progress_callback(1.0)
+        
+        return list(best_states.values())
+    
     def _try_perfect_solution(self) -> Optional[Dict]:
         """嘗試產生完美解（完全滿足所有硬約束且無空格）"""
         schedule = {}
-        for date_str in self.weekdays + self.holidays:
+        for date_str in self.schedule_dates:
             schedule[date_str] = ScheduleSlot(date=date_str)
         
-        used_quota = {}
+        used_quota = self._new_used_quota()
+        self._rebuild_run_state(schedule)
         
         # 使用標準策略：不可值班日最多的人先排，假日優先
         
-        # Step 1: 處理優先值班日
-        for date_str in self.holidays + self.weekdays:
-            if date_str not in self.preferred_assignments:
-                continue
-            
-            for role, doctors in self.preferred_assignments[date_str].items():
-                if doctors:
-                    # 選擇不可值班日最多的
-                    doctors_sorted = sorted(
-                        doctors,
-                        key=lambda d: self.doctor_unavailable_count[d],
-                        reverse=True
-                    )
-                    for doctor_name in doctors_sorted:
-                        if self._assign_doctor(schedule, date_str, role, doctor_name, used_quota):
-                            break
+        # Step 1: 處理優先值班日（選擇不可值班日最多的）
+        for date_str, role, _, doctors_sorted in self.preferred_slots:
+            for doctor_name in doctors_sorted:
+                if self._assign_doctor(schedule, date_str, role, doctor_name, used_quota):
+                    break
         
         # Step 2: 填充剩餘格子（假日優先）
-        for date_str in self.holidays + self.weekdays:
-            slot = schedule[date_str]
-            
-            # 填充主治
-            if not slot.attending:
-                # 按不可值班日數量排序
-                attending_sorted = sorted(
-                    self.attending_doctors,
-                    key=lambda d: self.doctor_unavailable_count[d.name],
-                    reverse=True
-                )
-                for doctor in attending_sorted:
-                    if self._assign_doctor(schedule, date_str, "主治", doctor.name, used_quota):
-                        break
-            
-            # 填充總醫師
-            if not slot.resident:
-                resident_sorted = sorted(
-                    self.resident_doctors,
-                    key=lambda d: self.doctor_unavailable_count[d.name],
-                    reverse=True
-                )
-                for doctor in resident_sorted:
-                    if self._assign_doctor(schedule, date_str, "總醫師", doctor.name, used_quota):
-                        break
+        # 與第一個方案相同的順序：以遮罩一次篩選同角色醫師，取不可值班日最多的可排者
+        self._fill_remaining_slots(schedule, used_quota, variant=0)
         
+        self._run_state = None
         return schedule
     
     def _is_complete(self, schedule: Dict) -> bool:
@@ -307,17 +664,31 @@ class Stage1Scheduler:
     def _greedy_initialization(self, beam_width: int) -> List[SchedulingState]:
         """產生初始解（使用相同策略但加入隨機性）"""
         initial_states = []
+        self._rng = np.random.default_rng(random.getrandbits(64))
+        
+        # Phase 1 的結果只取決於各優先值班日的醫師嘗試順序；
+        # 順序相同的方案（多數方案未觸發隨機打亂）直接複製先前的結果
+        phase1_results = {}
         
         for i in range(beam_width):
-            # 創建空白排班
-            schedule = {}
-            for date_str in self.weekdays + self.holidays:
-                schedule[date_str] = ScheduleSlot(date=date_str)
-            
-            used_quota = {}
-            
             # Phase 1: 處理優先值班日
-            self._handle_preferred_dates(schedule, used_quota, i)
+            orders = self._preferred_orders(i)
+            cached = phase1_results.get(orders)
+            if cached is not None:
+                schedule = clone_schedule(cached[0])
+                used_quota = cached[1].copy()
+                self._rebuild_run_state(schedule)
+            else:
+                # 創建空白排班
+                schedule = {}
+                for date_str in self.schedule_dates:
+                    schedule[date_str] = ScheduleSlot(date=date_str)
+                
+                used_quota = self._new_used_quota()
+                self._rebuild_run_state(schedule)
+                
+                self._handle_preferred_dates(schedule, used_quota, orders)
+                phase1_results[orders] = (clone_schedule(schedule), used_quota.copy())
             
             # Phase 2: 填充其他日期（假日優先，不可值班日多的人優先）
             self._fill_remaining_slots(schedule, used_quota, i)
@@ -326,101 +697,109 @@ class Stage1Scheduler:
             state = self._create_state(schedule)
             initial_states.append(state)
         
+        self._run_state = None
         return initial_states
     
-    def _handle_preferred_dates(self, schedule: Dict, used_quota: Dict, variant: int):
-        """處理優先值班日"""
-        for date_str in self.holidays + self.weekdays:
-            if date_str not in self.preferred_assignments:
-                continue
-            
-            for role, doctors in self.preferred_assignments[date_str].items():
-                if not doctors:
-                    continue
-                
-                # 如果多個醫師競爭，根據不可值班日數量排序
-                if len(doctors) > 1:
-                    # 加入一點隨機性
-                    if variant > 0 and random.random() < 0.3:
-                        doctors_sorted = doctors.copy()
-                        random.shuffle(doctors_sorted)
-                    else:
-                        doctors_sorted = sorted(
-                            doctors,
-                            key=lambda d: self.doctor_unavailable_count[d],
-                            reverse=True
-                        )
+    def _preferred_orders(self, variant: int) -> Tuple[Tuple[str, ...], ...]:
+        """決定各優先值班日（依 preferred_slots 順序）嘗試醫師的順序"""
+        orders = []
+        for date_str, role, doctors, by_unavailable in self.preferred_slots:
+            # 如果多個醫師競爭，根據不可值班日數量排序
+            if len(doctors) > 1:
+                # 加入一點隨機性
+                if variant > 0 and self._rng.random() < 0.3:
+                    doctors_sorted = [doctors[i] for i in self._rng.permutation(len(doctors))]
                 else:
-                    doctors_sorted = doctors
-                
-                for doctor_name in doctors_sorted:
-                    if self._assign_doctor(schedule, date_str, role, doctor_name, used_quota):
-                        break
-    
-    def _fill_remaining_slots(self, schedule: Dict, used_quota: Dict, variant: int):
-        """填充剩餘格子（假日優先，不可值班日多的人優先）"""
-        # 假日優先
-        for date_str in self.holidays + self.weekdays:
-            slot = schedule[date_str]
-            
-            # 填充主治
-            if not slot.attending:
-                candidates = self._get_sorted_candidates(
-                    date_str, "主治", schedule, used_quota, variant
-                )
-                for doctor_name in candidates:
-                    if self._assign_doctor(schedule, date_str, "主治", doctor_name, used_quota):
-                        break
-            
-            # 填充總醫師
-            if not slot.resident:
+                    doctors_sorted = by_unavailable
+            else:
+                doctors_sorted = doctors
+            orders.append(tuple(doctors_sorted))
+        return tuple(orders)
+    
+    def _handle_preferred_dates(self, schedule: Dict, used_quota: np.ndarray,
+                                orders: Tuple[Tuple[str, ...], ...]):
+        """處理優先值班日"""
+        for (date_str, role, _, _), doctors_sorted in zip(self.preferred_slots, orders):
+            for doctor_name in doctors_sorted:
+                if self._assign_doctor(schedule, date_str, role, doctor_name, used_quota):
+                    break
+    
+    def _fill_remaining_slots(self, schedule: Dict, used_quota: np.ndarray, variant: int):
+        """填充剩餘格子（假日優先，不可值班日多的人優先）
+        
+        候選醫師已通過所有硬約束檢查，直接分配第一位，不再經 _assign_doctor 重複檢查
+        """
+        # 假日優先；同一天依序填充主治、總醫師（已填的角色由 _get_sorted_candidates 直接回傳空串列）
+        for date_str in self.fill_order:
+            for role in ("主治", "總醫師"):
                 candidates = self._get_sorted_candidates(
-                    date_str, "總醫師", schedule, used_quota, variant
+                    date_str, role, schedule, used_quota, variant, limit=1
                 )
-                for doctor_name in candidates:
-                    if self._assign_doctor(schedule, date_str, "總醫師", doctor_name, used_quota):
-                        break
+                if candidates:
+                    self._place_doctor(schedule, date_str, role, candidates[0], used_quota)
     
     def _get_sorted_candidates(self, date_str: str, role: str, 
-                              schedule: Dict, used_quota: Dict, variant: int) -> List[str]:
-        """取得排序後的候選醫師（不可值班日多的優先）"""
-        doctors = self.attending_doctors if role == "主治" else self.resident_doctors
-        candidates = []
+                              schedule: Dict, used_quota: np.ndarray, variant: int,
+                              limit: Optional[int] = None) -> List[str]:
+        """取得排序後的候選醫師（不可值班日多的優先）
+        
+        配額、不可值班日、他人優先值班日與同日兼任以 NumPy 遮罩一次評估同角色所有醫師，
+        只有通過遮罩者才逐一檢查連續值班。
+        先決定醫師順序（第一個方案依不可值班日，其他方案以 NumPy 亂數打亂或加入擾動），
+        給定 limit 時只回傳前 limit 位，排名在後的醫師不必檢查連續值班。
+        """
+        slot = schedule[date_str]
+        if (slot.attending if role == "主治" else slot.resident) is not None:
+            return []
         
-        for doctor in doctors:
-            can_assign, _ = self._can_assign(doctor.name, date_str, role, schedule, used_quota)
-            if can_assign:
-                candidates.append(doctor.name)
+        arrays = self.role_arrays[role]
+        index = arrays['index']
+        date_idx = self.date_index[date_str]
+        quota_col = self.date_quota_cols[date_idx]
         
-        # 根據不可值班日數量排序（多的優先）
+        mask = (
+            (used_quota[index, quota_col] < arrays['quota_limits'][:, quota_col])
+            & ~arrays['blocked'][:, date_idx]
+        )
+        for name in (slot.attending, slot.resident):
+            if name is not None:
+                mask &= index != self.doctor_index[name]
+        
+        # 決定檢查順序（索引指向同角色醫師陣列）
         if variant == 0:
-            # 第一個方案：嚴格按照不可值班日排序
-            candidates.sort(key=lambda d: self.doctor_unavailable_count[d], reverse=True)
-        else:
+            # 第一個方案：嚴格按照不可值班日排序（多的優先）
+            order = arrays['by_unavailable']
+        elif self._rng.random() < 0.3:
             # 其他方案：加入一些隨機性
-            if random.random() < 0.3:
-                random.shuffle(candidates)
-            else:
-                candidates.sort(key=lambda d: (
-                    self.doctor_unavailable_count[d] + random.random() * 2
-                ), reverse=True)
+            order = self._rng.permutation(len(index))
+        else:
+            noisy_counts = arrays['unavailable_counts'] + self._rng.random(len(index)) * 2
+            order = np.argsort(-noisy_counts, kind='stable')
         
+        # 依序只對通過遮罩者檢查連續值班，湊滿 limit 位即停止
+        max_days = self.constraints.max_consecutive_days
+        candidates = []
+        for i in order[mask[order]]:
+            name = arrays['names'][i]
+            if self._check_consecutive_if_assigned(name, date_str, schedule, max_days) <= max_days:
+                candidates.append(name)
+                if len(candidates) == limit:
+                    break
         return candidates
     
     def _beam_search_optimization(self, initial_states: List[SchedulingState],
-                                  beam_width: int, progress_callback: Callable) -> List[SchedulingState]:
-        """Beam Search 優化"""
-        beam = []
-        for state in initial_states:
-            used_quota = self._calculate_used_quota(state.schedule)
-            beam.append({
-                'state': state,
-                'used_quota': used_quota
-            })
+                                  beam_width: int, progress_callback: Callable,
+                                  max_workers: Optional[int] = 1,
+                                  deadline: Optional[float] = None) -> List[SchedulingState]:
+        """Beam Search 優化
+        
+        deadline（time.monotonic 時刻）有給定時，超過即於步驟之間停止，回傳目前的束
+        """
+        beam = list(initial_states)
         
         # 收集未填格子（假日優先）
         unfilled = []
-        for date_str in self.holidays + self.weekdays:
+        for date_str in self.fill_order:
             slot = initial_states[0].schedule[date_str]
             
             if not slot.attending:
@@ -431,197 +810,420 @@ class Stage1Scheduler:
         max_steps = min(30, len(unfilled))
         self.diagnostic_info['beam_search_iterations'] = max_steps
         
-        for step, (date_str, role) in enumerate(unfilled[:max_steps]):
-            new_beam = []
-            
-            for item in beam:
-                current_state = item['state']
-                current_quota = copy.deepcopy(item['used_quota'])
-                
-                # 取得候選醫師（不可值班日多的優先）
-                candidates = self._get_beam_candidates(
-                    date_str, role, current_state.schedule, current_quota
-                )
+        capacity = beam_width * 2  # 保留更多候選以增加多樣性
+        
+        # 各父狀態的展開互相獨立，可交由行程池平行處理
+        executor = None
+        if max_steps > 0 and (max_workers is None or max_workers > 1):
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_beam_worker,
+                initargs=(self,)
+            )
+        
+        try:
+            for step, (date_str, role) in enumerate(unfilled[:max_steps]):
+                # 保留 Top-K：容量固定的最小堆，堆頂即為進入門檻
+                # 鍵為 (分數, -加入順序)，同分時先加入者優先，與穩定排序結果一致
+                heap = []
+                order = 0
                 
-                if not candidates:
-                    new_beam.append(item)
+                if executor is not None:
+                    # 子行程無法共享堆頂門檻，因此不剪枝，結果依原順序合併
+                    for children in executor.map(_expand_beam_state, beam,
+                                                 repeat(date_str), repeat(role)):
+                        for new_state in children:
+                            self._push_top_k(heap, (new_state.score, -order, new_state), capacity)
+                            order += 1
                 else:
-                    # 探索多個候選
-                    for i, doctor_name in enumerate(candidates[:3]):
-                        new_schedule = copy.deepcopy(current_state.schedule)
-                        new_quota = copy.deepcopy(current_quota)
+                    bound_gains = self._step_bound_gains(date_str, role)
+                    candidate_cache = {}
+                    for current_state in beam:
+                        # 父狀態的任何子狀態都無法進入 Top-K 時，連候選都不必計算
+                        if len(heap) >= capacity and \
+                           self._parent_upper_bound(current_state, bound_gains) <= heap[0][0]:
+                            self.diagnostic_info['pruned_parents'] += 1
+                            continue
                         
-                        if self._assign_doctor(new_schedule, date_str, role, doctor_name, new_quota):
-                            new_state = self._create_state(new_schedule)
-                            new_beam.append({
-                                'state': new_state,
-                                'used_quota': new_quota
-                            })
-            
-            # 保留 Top-K
-            if new_beam:
-                new_beam.sort(key=lambda x: x['state'].score, reverse=True)
-                beam = new_beam[:beam_width * 2]  # 保留更多候選以增加多樣性
-            
-            if progress_callback:
-                progress_callback((step + 1) / max_steps)
+                        # 取得候選醫師（不可值班日多的優先）
+                        candidates = self._get_beam_candidates(
+                            date_str, role, current_state,
+                            limit=self.constraints.branching_factor, cache=candidate_cache
+                        )
+                        
+                        # 沒有候選時保留原狀態，否則探索前 branching_factor 個候選
+                        for doctor_name in candidates or [None]:
+                            if doctor_name is None:
+                                new_state = current_state
+                            else:
+                                threshold = heap[0][0] if len(heap) >= capacity else None
+                                new_state = self._apply_move(
+                                    current_state, date_str, role, doctor_name, threshold
+                                )
+                                if new_state is None:
+                                    continue
+                            
+                            self._push_top_k(heap, (new_state.score, -order, new_state), capacity)
+                            order += 1
+                
+                if heap:
+                    beam = [state for _, _, state in sorted(heap, reverse=True)]
+                
+                if progress_callback:
+                    progress_callback((step + 1) / max_steps)
+                
+                if deadline is not None and time.monotonic() > deadline:
+                    self._log(f"⏱️ 已達時間上限，Beam Search 停止於第 {step + 1} 步", "info")
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown()
         
         # 返回所有探索到的狀態
-        return [item['state'] for item in beam]
+        for state in beam:
+            self._materialize_schedule(state)
+        return beam
     
-    def _get_beam_candidates(self, date_str: str, role: str,
-                            schedule: Dict, used_quota: Dict) -> List[str]:
-        """取得 Beam Search 的候選醫師"""
-        doctors = self.attending_doctors if role == "主治" else self.resident_doctors
-        candidates = []
+    def _step_bound_gains(self, date_str: str, role: str) -> Tuple[int, int, float]:
+        """本步填入一格時各統計最多增加多少（所有父狀態共用）
         
-        is_holiday = date_str in self.holidays
+        回傳 (優先值班日滿足數, 假日已填格數, 配額均衡度) 的增量上限
+        """
+        date_idx = self.date_index[date_str]
+        arrays = self.role_arrays[role]
         
-        for doctor in doctors:
-            can_assign, _ = self._can_assign(doctor.name, date_str, role, schedule, used_quota)
-            
-            if can_assign:
-                # 計算優先分數
-                score = 0
-                
-                # 1. 不可值班日多的優先（主要策略）
-                score += self.doctor_unavailable_count[doctor.name] * 100
-                
-                # 2. 優先值班日加分
-                if date_str in self.doctor_preferred[doctor.name]:
-                    score += 500
-                
-                # 3. 配額使用率（次要考慮）
-                quota_type = 'holiday' if is_holiday else 'weekday'
-                max_quota = doctor.holiday_quota if is_holiday else doctor.weekday_quota
-                used = used_quota.get(doctor.name, {}).get(quota_type, 0)
-                usage_rate = used / max(max_quota, 1)
-                score += (1 - usage_rate) * 10
-                
-                candidates.append((doctor.name, score))
+        preference_gain = 1 if arrays['preferred'][:, date_idx].any() else 0
+        holiday_gain = 1 if date_str in self.holiday_set else 0
         
-        # 排序並返回
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        return [name for name, _ in candidates]
+        # 與 _apply_move 相同：使用率改變 delta 時標準差最多改變 delta / sqrt(醫師數)
+        balance_gain = 0.0
+        if len(arrays['index']) > 0:
+            min_divisor = arrays['quota_divisors'][:, self.date_quota_cols[date_idx]].min()
+            balance_gain = 0.5 / min_divisor / np.sqrt(len(self.doctors)) + 1e-9
+        
+        return preference_gain, holiday_gain, balance_gain
     
-    def _calculate_used_quota(self, schedule: Dict) -> Dict:
-        """計算已使用配額"""
-        used_quota = {}
+    def _parent_upper_bound(self, state: SchedulingState,
+                            gains: Tuple[int, int, float]) -> float:
+        """父狀態填入本步這一格後可能達到的最高分數
+        
+        保留原狀態（無候選）時分數必低於此上界，因此上界不超過門檻即可略過整個父狀態。
+        """
+        preference_gain, holiday_gain, balance_gain = gains
+        return self._score_state(
+            state.filled_count + 1,
+            state.preference_satisfied + preference_gain,
+            state.holiday_filled + holiday_gain,
+            state.quota_balance + balance_gain,
+            state.consecutive_penalty
+        )
+    
+    def _materialize_schedule(self, state: SchedulingState):
+        """由醫師編號陣列建立對外使用的排班表（Beam Search 中間狀態不保存字典）"""
+        if state.schedule is not None:
+            return
         
-        for date_str, slot in schedule.items():
-            is_holiday = date_str in self.holidays
-            quota_type = 'holiday' if is_holiday else 'weekday'
-            
+        schedule = {}
+        for date_str in self.schedule_dates:
+            date_idx = self.date_index[date_str]
+            attending = state.attending_ids[date_idx]
+            resident = state.resident_ids[date_idx]
+            schedule[date_str] = ScheduleSlot(
+                date=date_str,
+                attending=self.doctors[attending].name if attending >= 0 else None,
+                resident=self.doctors[resident].name if resident >= 0 else None
+            )
+        state.schedule = schedule
+    
+    def _push_top_k(self, heap: List, entry: Tuple, capacity: int):
+        """將 (分數, -加入順序, 狀態) 放入容量固定的最小堆
+        
+        加入順序唯一，比較時不會比到狀態物件；堆滿時 heappushpop 會直接丟棄最差的一筆
+        """
+        if len(heap) < capacity:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+    
+    def _expand_state(self, state: SchedulingState, date_str: str, role: str) -> List[SchedulingState]:
+        """展開單一父狀態：沒有候選時保留原狀態，否則探索前 branching_factor 個候選"""
+        candidates = self._get_beam_candidates(
+            date_str, role, state, limit=self.constraints.branching_factor
+        )
+        if not candidates:
+            return [state]
+        
+        children = []
+        for doctor_name in candidates:
+            new_state = self._apply_move(state, date_str, role, doctor_name)
+            if new_state:
+                children.append(new_state)
+        return children
+    
+    def _apply_move(self, state: SchedulingState, date_str: str, role: str,
+                    doctor_name: str, threshold: Optional[float] = None) -> Optional[SchedulingState]:
+        """在父狀態上填入一格，並以增量方式更新配額與分數
+        
+        doctor_name 須為 _get_beam_candidates 回傳的候選（已通過所有硬約束）。
+        若給定 threshold，先估計子狀態的分數上界，
+        上界不超過 threshold 時直接剪枝（回傳 None），不建立新狀態。
+        """
+        is_holiday = date_str in self.holiday_set
+        filled_count = state.filled_count + 1
+        
+        date_idx = self.date_index[date_str]
+        preference_satisfied = state.preference_satisfied
+        if (self.preferred_bits[doctor_name] >> date_idx) & 1 and \
+           self.doctor_map[doctor_name].role == role:
+            preference_satisfied += 1
+        
+        holiday_filled = state.holiday_filled + (1 if is_holiday else 0)
+        
+        # 連續值班懲罰：候選已保證新造成的連續天數不超過上限，
+        # 其他醫師的連續段不受影響，因此沿用父狀態的懲罰值
+        consecutive_penalty = state.consecutive_penalty
+        
+        doctor_idx = self.doctor_index[doctor_name]
+        quota_col = QUOTA_HOLIDAY if is_holiday else QUOTA_WEEKDAY
+        
+        if threshold is not None:
+            # 單一醫師使用率改變 delta 時，標準差最多改變 delta / sqrt(醫師數)
+            delta = 0.5 / self.quota_divisors[doctor_idx, quota_col]
+            balance_bound = state.quota_balance + delta / np.sqrt(len(self.doctors)) + 1e-9
+            upper_bound = self._score_state(
+                filled_count, preference_satisfied, holiday_filled,
+                balance_bound, consecutive_penalty
+            )
+            if upper_bound <= threshold:
+                self.diagnostic_info['pruned_expansions'] += 1
+                return None
+        
+        # 醫師編號陣列：複製後只更新該日該角色（排班表字典待輸出前才建立）
+        attending_ids = state.attending_ids
+        resident_ids = state.resident_ids
+        if role == "主治":
+            attending_ids = attending_ids.copy()
+            attending_ids[date_idx] = doctor_idx
+        else:
+            resident_ids = resident_ids.copy()
+            resident_ids[date_idx] = doctor_idx
+        
+        # 配額：複製矩陣後只更新該醫師的計數
+        new_quota = state.used_quota.copy()
+        new_quota[doctor_idx, quota_col] += 1
+        
+        # 均衡度：只有該醫師的使用率增加 delta，以總和與平方和更新標準差
+        old_usage = self._doctor_usage(state.used_quota, doctor_idx)
+        delta = self.usage_weights[doctor_idx][quota_col]
+        usage_sum = state.usage_sum + delta
+        usage_sqsum = state.usage_sqsum + delta * (2 * old_usage + delta)
+        
+        # 未填格位：以 list.remove 在 C 層移除單一格位，不逐項比較 tuple 重建串列
+        unfilled_slots = list(state.unfilled_slots)
+        try:
+            unfilled_slots.remove((date_str, role))
+        except ValueError:
+            pass
+
+        quota_balance = self._balance_from_sums(usage_sum, usage_sqsum)
+        score = self._score_state(
+            filled_count, preference_satisfied, holiday_filled,
+            quota_balance, consecutive_penalty
+        )
+        
+        return SchedulingState(
+            schedule=None,
+            score=score,
+            filled_count=filled_count,
+            unfilled_slots=unfilled_slots,
+            used_quota=new_quota,
+            quota_balance=quota_balance,
+            usage_sum=usage_sum,
+            usage_sqsum=usage_sqsum,
+            preference_satisfied=preference_satisfied,
+            attending_ids=attending_ids,
+            resident_ids=resident_ids,
+            holiday_filled=holiday_filled,
+            consecutive_penalty=consecutive_penalty
+        )
+    
+    def _get_beam_candidates(self, date_str: str, role: str, state: SchedulingState,
+                             limit: Optional[int] = None,
+                             cache: Optional[Dict] = None) -> List[str]:
+        """取得 Beam Search 的候選醫師（以 NumPy 遮罩一次評估同角色所有醫師）
+        
+        給定 limit 時只回傳分數最高的前 limit 位，順序與完整排序後取前段相同。
+        cache 為同一步（同日期、同角色）共用的字典：候選只取決於同角色醫師的配額使用量
+        與該日前後 max_consecutive_days 天的排班，相同時直接沿用先前的結果。
+        """
+        date_idx = self.date_index[date_str]
+        attending_ids, resident_ids = state.attending_ids, state.resident_ids
+        if (attending_ids if role == "主治" else resident_ids)[date_idx] >= 0:
+            return []
+        
+        arrays = self.role_arrays[role]
+        names = arrays['names']
+        index = arrays['index']
+        quota_col = self.date_quota_cols[date_idx]
+        
+        used = state.used_quota[index, quota_col]
+        max_days = self.constraints.max_consecutive_days
+        
+        if cache is not None:
+            lo = max(0, date_idx - max_days)
+            hi = date_idx + max_days + 1
+            key = (used.tobytes(), attending_ids[lo:hi].tobytes(), resident_ids[lo:hi].tobytes())
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+            candidates = self._get_beam_candidates(date_str, role, state, limit)
+            cache[key] = candidates
+            return candidates
+        
+        # 配額、不可值班日、他人優先值班日、同日兼任
+        mask = (
+            (used < arrays['quota_limits'][:, quota_col])
+            & ~arrays['blocked'][:, date_idx]
+            & (index != attending_ids[date_idx])
+            & (index != resident_ids[date_idx])
+        )
+        
+        # 連續值班需看前後日期，只檢查通過遮罩的醫師
+        _mask_consecutive_violations(attending_ids, resident_ids, index, mask, date_idx, max_days)
+        
+        selected = np.flatnonzero(mask)
+        if len(selected) <= 1:
+            # 零或單一候選不需計算優先分數與排序
+            return [names[i] for i in selected]
+        
+        # 優先分數：不可值班日多的優先、優先值班日加分、配額使用率低者略優先
+        scores = (
+            arrays['priority'][selected]
+            + arrays['preferred'][selected, date_idx] * 500
+            + (1 - used[selected] / arrays['quota_divisors'][selected, quota_col]) * 10
+        )
+        
+        # 只需前 limit 名時先以 O(n) 的 partition 找出門檻，同分者一併保留再排序
+        if limit is not None and len(selected) > limit:
+            kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = np.flatnonzero(scores >= kth)
+            selected, scores = selected[keep], scores[keep]
+        
+        # 穩定排序，同分時維持醫師原始順序
+        order = np.argsort(-scores, kind='stable')[:limit]
+        return [names[selected[k]] for k in order]
+    
+    def _new_used_quota(self) -> np.ndarray:
+        """建立空白的已使用配額矩陣 (醫師數, 2)"""
+        return np.zeros((len(self.doctors), 2), dtype=np.int32)
+    
+    def _encode_schedule(self, schedule: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """將排班表轉為依日期排列的主治、總醫師編號陣列（-1 表示空格）"""
+        attending_ids = np.full(len(self.sorted_dates), -1, dtype=np.int16)
+        resident_ids = np.full(len(self.sorted_dates), -1, dtype=np.int16)
+        
+        for i, date_str in enumerate(self.sorted_dates):
+            slot = schedule[date_str]
             if slot.attending:
-                if slot.attending not in used_quota:
-                    used_quota[slot.attending] = {'weekday': 0, 'holiday': 0}
-                used_quota[slot.attending][quota_type] += 1
-            
+                attending_ids[i] = self.doctor_index[slot.attending]
             if slot.resident:
-                if slot.resident not in used_quota:
-                    used_quota[slot.resident] = {'weekday': 0, 'holiday': 0}
-                used_quota[slot.resident][quota_type] += 1
+                resident_ids[i] = self.doctor_index[slot.resident]
         
-        return used_quota
+        return attending_ids, resident_ids
     
     def _create_state(self, schedule: Dict) -> SchedulingState:
         """創建排班狀態"""
-        filled_count = 0
         unfilled_slots = []
-        
         for date_str, slot in schedule.items():
-            if slot.attending:
-                filled_count += 1
-            else:
+            if not slot.attending:
                 unfilled_slots.append((date_str, "主治"))
-            
-            if slot.resident:
-                filled_count += 1
-            else:
+            if not slot.resident:
                 unfilled_slots.append((date_str, "總醫師"))
         
+        attending_ids, resident_ids = self._encode_schedule(schedule)
+        
+        # 已填格數、配額、優先值班日滿足數、假日已填格數與連續值班懲罰一次掃描算出
+        filled_count, used_quota, preference_satisfied, holiday_filled, consecutive_penalty = _schedule_stats(
+            attending_ids, resident_ids, self.holiday_mask, self.preferred_matrix,
+            self.role_codes, len(self.doctors), self.constraints.max_consecutive_days
+        )
+        
         # 計算基於品質的分數
-        score = self._calculate_quality_score(schedule, filled_count)
+        usage_sum, usage_sqsum = self._usage_sums(used_quota)
+        quota_balance = self._balance_from_sums(usage_sum, usage_sqsum)
+        score = self._score_state(
+            filled_count, preference_satisfied, holiday_filled,
+            quota_balance, consecutive_penalty
+        )
         
         return SchedulingState(
             schedule=schedule,
             score=score,
             filled_count=filled_count,
-            unfilled_slots=unfilled_slots
+            unfilled_slots=unfilled_slots,
+            used_quota=used_quota,
+            quota_balance=quota_balance,
+            usage_sum=usage_sum,
+            usage_sqsum=usage_sqsum,
+            preference_satisfied=preference_satisfied,
+            attending_ids=attending_ids,
+            resident_ids=resident_ids,
+            holiday_filled=holiday_filled,
+            consecutive_penalty=consecutive_penalty
         )
     
-    def _calculate_quality_score(self, schedule: Dict, filled_count: int) -> float:
-        """計算基於品質的分數（你說這個OK）"""
-        score = 0.0
-        used_quota = self._calculate_used_quota(schedule)
-        
-        # 1. 填充率（最重要，權重1000）
-        total_slots = len(schedule) * 2
-        fill_rate = filled_count / total_slots if total_slots > 0 else 0
-        score += fill_rate * 1000
-        
-        # 2. 優先值班日滿足度（權重500）
-        pref_satisfied = 0
-        pref_total = 0
-        for doctor in self.doctors:
-            for pref_date in self.doctor_preferred[doctor.name]:
-                if pref_date in schedule:
-                    pref_total += 1
-                    slot = schedule[pref_date]
-                    if (doctor.role == "主治" and slot.attending == doctor.name) or \
-                       (doctor.role == "總醫師" and slot.resident == doctor.name):
-                        pref_satisfied += 1
-        
-        if pref_total > 0:
-            score += (pref_satisfied / pref_total) * 500
-        
-        # 3. 假日覆蓋率（權重200）
-        holiday_filled = 0
-        for d in self.holidays:
-            if d in schedule:
-                if schedule[d].attending:
-                    holiday_filled += 1
-                if schedule[d].resident:
-                    holiday_filled += 1
-        holiday_coverage = holiday_filled / (len(self.holidays) * 2) if self.holidays else 0
-        score += holiday_coverage * 200
-        
-        # 4. 配額使用均衡度（權重100）
-        usage_variance = []
-        for doctor in self.doctors:
-            weekday_used = used_quota.get(doctor.name, {}).get('weekday', 0)
-            holiday_used = used_quota.get(doctor.name, {}).get('holiday', 0)
+    def _build_score_function(self) -> Callable[[int, int, int, float, float], float]:
+        """產生本月專用的計分函式
+        
+        日期數、假日數與優先值班日總數在整個排班期間固定，先代入為區域常數，
+        Beam Search 每次計分時不必再查屬性或計算長度。
+        """
+        total_slots = len(self.sorted_dates) * 2
+        holiday_slots = len(self.holidays) * 2
+        preference_total = self.preference_total
+        
+        def score_state(filled_count: int, preference_satisfied: int, holiday_filled: int,
+                        quota_balance: float, consecutive_penalty: float) -> float:
+            """由各項統計組合出基於品質的分數"""
+            score = 0.0
             
-            weekday_rate = weekday_used / max(doctor.weekday_quota, 1)
-            holiday_rate = holiday_used / max(doctor.holiday_quota, 1)
+            # 1. 填充率（最重要，權重1000）
+            fill_rate = filled_count / total_slots if total_slots > 0 else 0
+            score += fill_rate * 1000
             
-            usage_variance.append((weekday_rate + holiday_rate) / 2)
-        
-        if usage_variance:
-            balance = 1 - np.std(usage_variance)
-            score += balance * 100
-        
-        # 5. 連續值班懲罰
-        consecutive_penalty = 0
-        for doctor in self.doctors:
-            max_consecutive = self._check_max_consecutive(doctor.name, schedule)
-            if max_consecutive > self.constraints.max_consecutive_days:
-                consecutive_penalty += (max_consecutive - self.constraints.max_consecutive_days) * 50
-        score -= consecutive_penalty
+            # 2. 優先值班日滿足度（權重500）
+            if preference_total > 0:
+                score += (preference_satisfied / preference_total) * 500
+            
+            # 3. 假日覆蓋率（權重200）
+            holiday_coverage = holiday_filled / holiday_slots if holiday_slots > 0 else 0
+            score += holiday_coverage * 200
+            
+            # 4. 配額使用均衡度（權重100）
+            score += quota_balance * 100
+            
+            # 5. 連續值班懲罰
+            score -= consecutive_penalty
+            
+            return score
         
-        return score
+        return score_state
     
-    def _check_max_consecutive(self, doctor_name: str, schedule: Dict) -> int:
-        """檢查最大連續值班天數"""
-        max_consecutive = 0
-        current_consecutive = 0
-        
-        for date_str in sorted(schedule.keys()):
-            slot = schedule[date_str]
-            if doctor_name == slot.attending or doctor_name == slot.resident:
-                current_consecutive += 1
-                max_consecutive = max(max_consecutive, current_consecutive)
-            else:
-                current_consecutive = 0
-        
-        return max_consecutive
\ No newline at end of file
+    def _doctor_usage(self, used_quota: np.ndarray, doctor_idx: int) -> int:
+        """單一醫師的配額使用率（平日與假日使用率的平均），以 usage_scale 為單位的整數"""
+        weights = self.usage_weights[doctor_idx]
+        return (int(used_quota[doctor_idx, QUOTA_WEEKDAY]) * weights[QUOTA_WEEKDAY]
+                + int(used_quota[doctor_idx, QUOTA_HOLIDAY]) * weights[QUOTA_HOLIDAY])
+    
+    def _usage_sums(self, used_quota: np.ndarray) -> Tuple[int, int]:
+        """各醫師配額使用率的總和與平方和（整數單位）"""
+        usage = [self._doctor_usage(used_quota, i) for i in range(len(self.doctors))]
+        return sum(usage), sum(u * u for u in usage)
+    
+    def _balance_from_sums(self, usage_sum: int, usage_sqsum: int) -> float:
+        """配額使用均衡度：1 - 各醫師使用率的標準差（由總和與平方和直接求得）"""
+        n = len(self.doctors)
+        if n == 0:
+            return 0.0
+        # n·Σu² - (Σu)² 為精確整數且不小於 0，最後才換算回使用率的尺度
+        return 1 - math.sqrt(n * usage_sqsum - usage_sum * usage_sum) / (n * self.usage_scale)
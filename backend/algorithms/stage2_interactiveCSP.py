@@ -3,15 +3,14 @@ Stage 2: 進階智慧交換補洞系統（完整優化版）
 包含深度搜索、多步交換鏈、回溯機制
 增強版：詳細繁體中文日誌（簡化版）
 """
-import copy
+import heapq
 import time
 from typing import List, Dict, Tuple, Optional, Set, Any, Callable
 from dataclasses import dataclass, field
-from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
-from backend.models import Doctor, ScheduleSlot
+from backend.models import Doctor, ScheduleSlot, clone_schedule
 from backend.utils import check_consecutive_days
 
 @dataclass
@@ -66,11 +65,12 @@ class Stage2AdvancedSwapper:
     def __init__(self, schedule: Dict[str, ScheduleSlot], 
              doctors: List[Doctor], constraints,
              weekdays: List[str], holidays: List[str]):
-        self.schedule = copy.deepcopy(schedule)
+        self.schedule = clone_schedule(schedule)
         self.doctors = doctors
         self.constraints = constraints
         self.weekdays = weekdays
         self.holidays = holidays
+        self.holiday_set = frozenset(holidays)  # 假日判斷用，避免在熱路徑上掃描 list
         
         # 日誌回調和控制 - 必須最先初始化
         self.log_callback: Optional[Callable[[str, str], None]] = None
@@ -83,6 +83,45 @@ class Stage2AdvancedSwapper:
         # 建立醫師索引
         self.doctor_map = {d.name: d for d in doctors}
         
+        # 每位醫師的不可值班日、優先值班日集合（成員檢查不再逐一掃描 list）
+        self.doctor_unavailable: Dict[str, frozenset] = {
+            d.name: frozenset(d.unavailable_dates) for d in doctors
+        }
+        self.doctor_preferred: Dict[str, frozenset] = {
+            d.name: frozenset(d.preferred_dates) for d in doctors
+        }
+        
+        # 預先解析所有日期：週末判斷、日期與連續值班檢查要看的前後日期
+        #（空缺分析與連續值班檢查時不再逐次 strptime/strftime）
+        self.weekend_dates: Set[str] = set()
+        self.date_days: Dict[str, int] = {}
+        self._consecutive_neighbors: Dict[str, Tuple[List[str], List[str]]] = {}
+        span = range(1, self.constraints.max_consecutive_days)
+        for date_str in self.schedule:
+            try:
+                dt = datetime.strptime(date_str, "%Y-%m-%d")
+            except (ValueError, TypeError):
+                continue
+            self.date_days[date_str] = dt.day
+            if dt.weekday() in [5, 6]:  # 週六、週日
+                self.weekend_dates.add(date_str)
+            self._consecutive_neighbors[date_str] = (
+                [(dt - timedelta(days=i)).strftime("%Y-%m-%d") for i in span],
+                [(dt + timedelta(days=i)).strftime("%Y-%m-%d") for i in span]
+            )
+        
+        # 以下快取與 current_duties 依賴排班表的每次變動都經過 update_slot 或 _restore_state，
+        # 不可直接指定 self.schedule[date] 或修改格位欄位，否則快取會過時
+
+        # 連續值班檢查快取 (doctor_name, date) -> 是否違反；排班表變動時清空
+        self._consecutive_cache: Dict[Tuple[str, str], bool] = {}
+        
+        # 醫師 -> 其班次 [(date, role)]（依排班表順序）；排班表變動時重建
+        self._shift_index: Optional[Dict[str, List[Tuple[str, str]]]] = None
+        
+        # (doctor_name, is_holiday) -> 可交換的同類型未鎖定班次；排班表變動時清空
+        self._swappable_cache: Dict[Tuple[str, bool], List[Tuple[str, str]]] = {}
+        
         # 計算每位醫師當前的班數
         self.current_duties = self._count_all_duties()  # 現在可以安全呼叫 _log
         
@@ -149,24 +188,21 @@ class Stage2AdvancedSwapper:
     def _count_all_duties(self) -> Dict[str, Dict]:
         """計算所有醫師的當前班數"""
         self._log("📊 正在計算所有醫師的當前班數...", "info")
-        duties = defaultdict(lambda: {'weekday': 0, 'holiday': 0, 'total': 0})
+        # 預先為所有醫師建立計數，排班表中的其他姓名才個別補上
+        duties = {
+            d.name: {'weekday': 0, 'holiday': 0, 'total': 0} for d in self.doctors
+        }
         
         for date_str, slot in self.schedule.items():
-            is_holiday = date_str in self.holidays
+            quota_type = 'holiday' if date_str in self.holiday_set else 'weekday'
             
-            if slot.attending:
-                if is_holiday:
-                    duties[slot.attending]['holiday'] += 1
-                else:
-                    duties[slot.attending]['weekday'] += 1
-                duties[slot.attending]['total'] += 1
-            
-            if slot.resident:
-                if is_holiday:
-                    duties[slot.resident]['holiday'] += 1
-                else:
-                    duties[slot.resident]['weekday'] += 1
-                duties[slot.resident]['total'] += 1
+            for name in (slot.attending, slot.resident):
+                if name:
+                    counts = duties.get(name)
+                    if counts is None:
+                        counts = duties[name] = {'weekday': 0, 'holiday': 0, 'total': 0}
+                    counts[quota_type] += 1
+                    counts['total'] += 1
         
         self._log(f"✅ 已計算 {len(duties)} 位醫師的班數統計", "success")
         return duties
@@ -179,12 +215,12 @@ class Stage2AdvancedSwapper:
         for date_str, slot in self.schedule.items():
             if slot.attending:
                 doctor = self.doctor_map.get(slot.attending)
-                if doctor and date_str in doctor.preferred_dates:
+                if doctor and date_str in self.doctor_preferred[doctor.name]:
                     locked.add((date_str, "主治", slot.attending))
                     
             if slot.resident:
                 doctor = self.doctor_map.get(slot.resident)
-                if doctor and date_str in doctor.preferred_dates:
+                if doctor and date_str in self.doctor_preferred[doctor.name]:
                     locked.add((date_str, "總醫師", slot.resident))
         
         self._log(f"🔍 找到 {len(locked)} 個鎖定班次（優先值班日）", "info")
@@ -222,7 +258,7 @@ class Stage2AdvancedSwapper:
     
     def _analyze_single_gap_advanced(self, date: str, role: str) -> Optional[GapInfo]:
         """進階單個空缺分析"""
-        is_holiday = date in self.holidays
+        is_holiday = date in self.holiday_set
         is_weekend = self._is_weekend(date)
         
         gap = GapInfo(
@@ -232,38 +268,35 @@ class Stage2AdvancedSwapper:
             is_weekend=is_weekend
         )
         
+        # 與醫師無關的值在迴圈外取一次
+        quota_type = 'holiday' if is_holiday else 'weekday'
+        slot = self.schedule[date]
+        
         # 分類候選醫師
         for doctor in self.doctors:
             if doctor.role != role:
                 continue
             
             # 基本檢查
-            if date in doctor.unavailable_dates:
+            if date in self.doctor_unavailable[doctor.name]:
                 continue
             
             # 檢查是否已在同一天有班
-            slot = self.schedule[date]
-            if doctor.name in [slot.attending, slot.resident]:
+            if slot.attending == doctor.name or slot.resident == doctor.name:
                 continue
             
             # 檢查連續值班
-            if check_consecutive_days(self.schedule, doctor.name, date, 
-                                     self.constraints.max_consecutive_days):
+            if self._would_violate_consecutive(doctor.name, date):
                 continue
             
             # 檢查配額
             current = self.current_duties[doctor.name]
+            quota = doctor.holiday_quota if is_holiday else doctor.weekday_quota
             
-            if is_holiday:
-                if current['holiday'] < doctor.holiday_quota:
-                    gap.candidates_with_quota.append(doctor.name)  # B類
-                else:
-                    gap.candidates_over_quota.append(doctor.name)  # A類
+            if current[quota_type] < quota:
+                gap.candidates_with_quota.append(doctor.name)  # B類
             else:
-                if current['weekday'] < doctor.weekday_quota:
-                    gap.candidates_with_quota.append(doctor.name)  # B類
-                else:
-                    gap.candidates_over_quota.append(doctor.name)  # A類
+                gap.candidates_over_quota.append(doctor.name)  # A類
         
         # 計算評分指標
         gap.severity = self._calculate_severity(gap)
@@ -275,11 +308,7 @@ class Stage2AdvancedSwapper:
     
     def _is_weekend(self, date_str: str) -> bool:
         """判斷是否為週末"""
-        try:
-            dt = datetime.strptime(date_str, "%Y-%m-%d")
-            return dt.weekday() in [5, 6]  # 週六、週日
-        except:
-            return False
+        return date_str in self.weekend_dates
     
     def _calculate_severity(self, gap: GapInfo) -> float:
         """計算嚴重度（0-100）"""
@@ -308,13 +337,12 @@ class Stage2AdvancedSwapper:
     
     def _calculate_future_impact(self, gap: GapInfo) -> float:
         """計算對未來排班的影響"""
-        impact = 0.0
+        day = self.date_days.get(gap.date)
         
-        try:
-            dt = datetime.strptime(gap.date, "%Y-%m-%d")
-            days_from_end = 31 - dt.day
+        if day is not None:
+            days_from_end = 31 - day
             impact = days_from_end * 2  # 越接近月底，影響越小
-        except:
+        else:
             impact = 50.0
         
         return min(100, impact)
@@ -476,6 +504,8 @@ class Stage2AdvancedSwapper:
         """
         available = []
         is_holiday = date_str in holidays
+        quota_type = 'holiday' if is_holiday else 'weekday'
+        slot = schedule.get(date_str)  # 與醫師無關，迴圈外取一次
         
         for doctor in self.doctors:
             # 檢查職位是否匹配
@@ -485,28 +515,21 @@ class Stage2AdvancedSwapper:
                 continue
                 
             # 基本檢查：不可值班日
-            if date_str in doctor.unavailable_dates:
+            if date_str in self.doctor_unavailable[doctor.name]:
                 continue
                 
             # 檢查是否已在同一天有班
-            if date_str in schedule:
-                slot = schedule[date_str]
-                if doctor.name in [slot.attending, slot.resident]:
-                    continue
+            if slot is not None and (slot.attending == doctor.name or slot.resident == doctor.name):
+                continue
             
-            # 檢查連續值班限制
-            if self._would_violate_consecutive(doctor.name, date_str):
+            # 檢查配額（所有醫師皆已預先建立計數，不必每次建立預設字典）
+            quota = doctor.holiday_quota if is_holiday else doctor.weekday_quota
+            if self.current_duties[doctor.name][quota_type] >= quota:
                 continue
-                
-            # 檢查配額
-            current_duties = self.current_duties.get(doctor.name, {'weekday': 0, 'holiday': 0, 'total': 0})
             
-            if is_holiday:
-                if current_duties['holiday'] < doctor.holiday_quota:
-                    available.append(doctor.name)
-            else:
-                if current_duties['weekday'] < doctor.weekday_quota:
-                    available.append(doctor.name)
+            # 檢查連續值班限制（需查看前後日期，放在最後）
+            if not self._would_violate_consecutive(doctor.name, date_str):
+                available.append(doctor.name)
         
         return available
     
@@ -524,10 +547,10 @@ class Stage2AdvancedSwapper:
         # 找出所有可能接手的醫師
         candidates = self._find_all_replacement_candidates(shift_date, shift_role, original_role)
         
-        # 按優先級排序候選人
-        candidates = self._prioritize_candidates(candidates, shift_date)
+        # 按優先級排序候選人，只考慮前15個
+        candidates = self._prioritize_candidates(candidates, shift_date, limit=15)
         
-        for candidate in candidates[:15]:  # 考慮前15個候選人
+        for candidate in candidates:
             if candidate['type'] == 'direct':
                 # 可以直接接手（有配額）
                 step = SwapStep(
@@ -577,128 +600,92 @@ class Stage2AdvancedSwapper:
     
     def _find_removable_shifts(self, doctor: Doctor, gap: GapInfo) -> List[Tuple[str, str]]:
         """找出醫師可以被移除的班次"""
-        removable = []
-        
-        for date_str, slot in self.schedule.items():
-            if date_str == gap.date:
-                continue
-            
-            # 檢查是否為該醫師的班
-            if slot.attending == doctor.name and doctor.role == "主治":
-                # 檢查是否被鎖定
-                if (date_str, "主治", doctor.name) not in self.locked_assignments:
-                    # 檢查是否同類型（假日對假日，平日對平日）
-                    is_holiday = date_str in self.holidays
-                    if is_holiday == gap.is_holiday:
-                        removable.append((date_str, "主治"))
-            
-            if slot.resident == doctor.name and doctor.role == "總醫師":
-                if (date_str, "總醫師", doctor.name) not in self.locked_assignments:
-                    is_holiday = date_str in self.holidays
-                    if is_holiday == gap.is_holiday:
-                        removable.append((date_str, "總醫師"))
-        
-        return removable
+        # 排除空缺當天與鎖定班次，只取同類型（假日對假日，平日對平日）
+        return [
+            (date_str, role)
+            for date_str, role in self._find_swappable_dates_for_doctor(doctor, gap.is_holiday)
+            if date_str != gap.date
+        ]
     
     def _find_all_replacement_candidates(self, date: str, role: str, 
                                         original_role: str) -> List[Dict]:
         """找出所有可能接手班次的候選人"""
         candidates = []
-        is_holiday = date in self.holidays
+        is_holiday = date in self.holiday_set
+        
+        # 與醫師無關的值在迴圈外取一次
+        quota_type = 'holiday' if is_holiday else 'weekday'
+        slot = self.schedule[date]
         
         for doctor in self.doctors:
             if doctor.role != original_role:
                 continue
             
             # 基本檢查
-            if date in doctor.unavailable_dates:
+            if date in self.doctor_unavailable[doctor.name]:
                 continue
             
             # 檢查是否已在同一天有班
-            slot = self.schedule[date]
-            if doctor.name in [slot.attending, slot.resident]:
+            if slot.attending == doctor.name or slot.resident == doctor.name:
                 continue
             
             # 檢查連續值班
-            if check_consecutive_days(self.schedule, doctor.name, date, 
-                                     self.constraints.max_consecutive_days):
+            if self._would_violate_consecutive(doctor.name, date):
                 continue
             
             # 檢查配額
             current = self.current_duties[doctor.name]
+            quota = doctor.holiday_quota if is_holiday else doctor.weekday_quota
             
-            if is_holiday:
-                if current['holiday'] < doctor.holiday_quota:
-                    # 可以直接接手
-                    candidates.append({
-                        'name': doctor.name,
-                        'type': 'direct',
-                        'priority': 1,
-                        'score': 100 - current['total']  # 班數越少優先級越高
-                    })
-                else:
-                    # 需要交換其他班次
-                    swappable_dates = self._find_swappable_dates_for_doctor(doctor, is_holiday)
-                    for swap_date, swap_role in swappable_dates:
-                        candidates.append({
-                            'name': doctor.name,
-                            'type': 'needs_swap',
-                            'from_date': swap_date,
-                            'from_role': swap_role,
-                            'role': doctor.role,
-                            'priority': 2,
-                            'score': 50 - current['total']
-                        })
+            if current[quota_type] < quota:
+                # 可以直接接手
+                candidates.append({
+                    'name': doctor.name,
+                    'type': 'direct',
+                    'priority': 1,
+                    'score': 100 - current['total']  # 班數越少優先級越高
+                })
             else:
-                # 平日邏輯
-                if current['weekday'] < doctor.weekday_quota:
+                # 需要交換其他班次
+                swappable_dates = self._find_swappable_dates_for_doctor(doctor, is_holiday)
+                for swap_date, swap_role in swappable_dates:
                     candidates.append({
                         'name': doctor.name,
-                        'type': 'direct',
-                        'priority': 1,
-                        'score': 100 - current['total']
+                        'type': 'needs_swap',
+                        'from_date': swap_date,
+                        'from_role': swap_role,
+                        'role': doctor.role,
+                        'priority': 2,
+                        'score': 50 - current['total']
                     })
-                else:
-                    swappable_dates = self._find_swappable_dates_for_doctor(doctor, is_holiday)
-                    for swap_date, swap_role in swappable_dates:
-                        candidates.append({
-                            'name': doctor.name,
-                            'type': 'needs_swap',
-                            'from_date': swap_date,
-                            'from_role': swap_role,
-                            'role': doctor.role,
-                            'priority': 2,
-                            'score': 50 - current['total']
-                        })
         
         return candidates
     
     def _find_swappable_dates_for_doctor(self, doctor: Doctor, is_holiday: bool) -> List[Tuple[str, str]]:
-        """找出醫師可以交換的班次"""
-        swappable = []
-        
-        for date_str, slot in self.schedule.items():
-            # 只找同類型的班次
-            date_is_holiday = date_str in self.holidays
-            if date_is_holiday != is_holiday:
-                continue
-            
-            # 檢查是否為該醫師的班
-            if slot.attending == doctor.name and doctor.role == "主治":
-                # 檢查是否被鎖定
-                if (date_str, "主治", doctor.name) not in self.locked_assignments:
-                    swappable.append((date_str, "主治"))
-            
-            if slot.resident == doctor.name and doctor.role == "總醫師":
-                if (date_str, "總醫師", doctor.name) not in self.locked_assignments:
-                    swappable.append((date_str, "總醫師"))
-        
-        return swappable
+        """找出醫師可以交換的班次（同一排班表狀態下結果會被快取）"""
+        key = (doctor.name, is_holiday)
+        shifts = self._swappable_cache.get(key)
+        if shifts is None:
+            # 只找同類型且未被鎖定的班次
+            shifts = [
+                (date_str, role) for date_str, role in self._get_doctor_shifts(doctor)
+                if (date_str in self.holiday_set) == is_holiday
+                and (date_str, role, doctor.name) not in self.locked_assignments
+            ]
+            self._swappable_cache[key] = shifts
+        return shifts
     
-    def _prioritize_candidates(self, candidates: List[Dict], date: str) -> List[Dict]:
-        """按優先級排序候選人"""
+    def _prioritize_candidates(self, candidates: List[Dict], date: str,
+                               limit: Optional[int] = None) -> List[Dict]:
+        """按優先級排序候選人
+        
+        給定 limit 時以部分排序只取前 limit 名，結果與完整排序後取前段相同
+        """
         # 先按類型排序（direct優先），再按分數排序
-        return sorted(candidates, key=lambda x: (x['priority'], -x['score']))
+        key = lambda x: (x['priority'], -x['score'])
+        if limit is not None:
+            return heapq.nsmallest(limit, candidates, key=key)
+        return sorted(candidates, key=key)
     
     def _find_aggressive_swap_chains(self, gap: GapInfo, max_depth: int) -> List[SwapChain]:
         """更激進的搜索策略"""
@@ -711,18 +698,11 @@ class Stage2AdvancedSwapper:
             doctor = self.doctor_map[doctor_name]
             
             # 找出所有班次（不限同類型）
-            all_shifts = []
-            for date_str, slot in self.schedule.items():
-                if date_str == gap.date:
-                    continue
-                
-                if slot.attending == doctor.name and doctor.role == "主治":
-                    if (date_str, "主治", doctor.name) not in self.locked_assignments:
-                        all_shifts.append((date_str, "主治"))
-                
-                if slot.resident == doctor.name and doctor.role == "總醫師":
-                    if (date_str, "總醫師", doctor.name) not in self.locked_assignments:
-                        all_shifts.append((date_str, "總醫師"))
+            all_shifts = [
+                (date_str, role) for date_str, role in self._get_doctor_shifts(doctor)
+                if date_str != gap.date
+                and (date_str, role, doctor.name) not in self.locked_assignments
+            ]
             
             # 嘗試每個班次
             for shift_date, shift_role in all_shifts[:3]:  # 只試前3個
@@ -762,9 +742,9 @@ class Stage2AdvancedSwapper:
                 continue
             
             # 放寬條件檢查
-            if shift_date not in other_doctor.unavailable_dates:
+            if shift_date not in self.doctor_unavailable[other_doctor.name]:
                 slot = self.schedule[shift_date]
-                if other_doctor.name not in [slot.attending, slot.resident]:
+                if slot.attending != other_doctor.name and slot.resident != other_doctor.name:
                     step2 = SwapStep(
                         description=f"[強制] {other_doctor.name} 接手 {shift_date}",
                         from_date="",
@@ -840,8 +820,8 @@ class Stage2AdvancedSwapper:
         impact = 5.0
         
         # 如果跨類型（假日換平日），增加影響
-        from_is_holiday = from_date in self.holidays
-        to_is_holiday = to_date in self.holidays
+        from_is_holiday = from_date in self.holiday_set
+        to_is_holiday = to_date in self.holiday_set
         
         if from_is_holiday != to_is_holiday:
             impact += 10.0
@@ -868,7 +848,7 @@ class Stage2AdvancedSwapper:
     
     def _simulate_chain(self, steps: List[SwapStep]) -> Dict[str, ScheduleSlot]:
         """模擬執行交換鏈"""
-        temp_schedule = copy.deepcopy(self.schedule)
+        temp_schedule = clone_schedule(self.schedule)
         
         for step in steps:
             if step.from_date:
@@ -891,39 +871,30 @@ class Stage2AdvancedSwapper:
         """計算排班違規數"""
         violations = 0
         
-        # 重新計算班數
-        duties = defaultdict(lambda: {'weekday': 0, 'holiday': 0})
+        # 重新計算班數（平日、假日各一個扁平計數表）
+        weekday_counts = {}
+        holiday_counts = {}
         
         for date_str, slot in schedule.items():
-            is_holiday = date_str in self.holidays
+            counts = holiday_counts if date_str in self.holiday_set else weekday_counts
             
             if slot.attending:
-                if is_holiday:
-                    duties[slot.attending]['holiday'] += 1
-                else:
-                    duties[slot.attending]['weekday'] += 1
-            
+                counts[slot.attending] = counts.get(slot.attending, 0) + 1
             if slot.resident:
-                if is_holiday:
-                    duties[slot.resident]['holiday'] += 1
-                else:
-                    duties[slot.resident]['weekday'] += 1
+                counts[slot.resident] = counts.get(slot.resident, 0) + 1
         
         # 檢查配額違規
         for doctor in self.doctors:
-            if duties[doctor.name]['weekday'] > doctor.weekday_quota:
+            if weekday_counts.get(doctor.name, 0) > doctor.weekday_quota:
                 violations += 1
-            if duties[doctor.name]['holiday'] > doctor.holiday_quota:
+            if holiday_counts.get(doctor.name, 0) > doctor.holiday_quota:
                 violations += 1
         
         return violations
     
-    def _generate_state_signature(self, chain: SwapChain) -> str:
-        """生成狀態簽名用於去重"""
-        sig_parts = []
-        for step in chain.steps:
-            sig_parts.append(f"{step.doctor}:{step.from_date}→{step.to_date}")
-        return "|".join(sorted(sig_parts))
+    def _generate_state_signature(self, chain: SwapChain) -> Tuple:
+        """生成狀態簽名用於去重（排序後的步驟欄位 tuple，不必逐步格式化字串）"""
+        return tuple(sorted((step.doctor, step.from_date, step.to_date) for step in chain.steps))
     
     def _deduplicate_chains(self, chains: List[SwapChain]) -> List[SwapChain]:
         """去除重複的交換鏈"""
@@ -941,17 +912,17 @@ class Stage2AdvancedSwapper:
     def _can_take_over_safely(self, doctor: Doctor, date: str, role: str) -> bool:
         """安全檢查是否可以接手班次"""
         # 不可值班日
-        if date in doctor.unavailable_dates:
+        if date in self.doctor_unavailable[doctor.name]:
             return False
         
         # 檢查是否已在同一天有班
         slot = self.schedule[date]
-        if doctor.name in [slot.attending, slot.resident]:
+        if slot.attending == doctor.name or slot.resident == doctor.name:
             return False
         
         # 檢查配額
         current = self.current_duties[doctor.name]
-        is_holiday = date in self.holidays
+        is_holiday = date in self.holiday_set
         
         if is_holiday:
             if current['holiday'] >= doctor.holiday_quota:
@@ -961,8 +932,7 @@ class Stage2AdvancedSwapper:
                 return False
         
         # 檢查連續值班
-        if check_consecutive_days(self.schedule, doctor.name, date, 
-                                 self.constraints.max_consecutive_days):
+        if self._would_violate_consecutive(doctor.name, date):
             return False
         
         return True
@@ -985,21 +955,12 @@ class Stage2AdvancedSwapper:
                     self._log(f"   步驟 {i+1}: {step.description}", "info")
                 
                 if step.from_date:  # 移除步驟
-                    slot = self.schedule[step.from_date]
-                    if step.role == "主治":
-                        slot.attending = None
-                    else:
-                        slot.resident = None
+                    self.update_slot(step.from_date, step.role, None)
                 
                 if step.to_date:  # 填入步驟
-                    slot = self.schedule[step.to_date]
-                    if step.role == "主治":
-                        slot.attending = step.doctor
-                    else:
-                        slot.resident = step.doctor
+                    self.update_slot(step.to_date, step.role, step.doctor)
             
-            # 重新計算班數和空缺
-            self.current_duties = self._count_all_duties()
+            # 班數已隨每個步驟增量更新，只需重新分析空缺
             self.gaps = self._analyze_gaps_advanced()
             
             # 記錄應用的交換
@@ -1013,6 +974,31 @@ class Stage2AdvancedSwapper:
             self._restore_state()
             return False
     
+    def update_slot(self, date_str: str, role: str, doctor_name: Optional[str]):
+        """設定某日某角色的醫師（None 表示清空），並增量更新原醫師與新醫師的班數統計"""
+        slot = self.schedule[date_str]
+        previous = slot.attending if role == "主治" else slot.resident
+        if previous == doctor_name:
+            return
+        
+        if role == "主治":
+            slot.attending = doctor_name
+        else:
+            slot.resident = doctor_name
+        self._invalidate_schedule_caches()
+        
+        quota_type = 'holiday' if date_str in self.holiday_set else 'weekday'
+        if previous:
+            counts = self.current_duties[previous]
+            counts[quota_type] -= 1
+            counts['total'] -= 1
+        if doctor_name:
+            counts = self.current_duties.setdefault(
+                doctor_name, {'weekday': 0, 'holiday': 0, 'total': 0}
+            )
+            counts[quota_type] += 1
+            counts['total'] += 1
+    
     def run_auto_fill_with_backtracking(self, max_backtracks: int = 20) -> Dict:
         """執行自動填補（含回溯）"""
         # 設定日誌級別為正常模式
@@ -1138,18 +1124,8 @@ class Stage2AdvancedSwapper:
     def _apply_direct_fill(self, gap: GapInfo, doctor_name: str) -> bool:
         """直接填補空缺"""
         try:
-            # 更新排班
-            if gap.role == "主治":
-                self.schedule[gap.date].attending = doctor_name
-            else:
-                self.schedule[gap.date].resident = doctor_name
-            
-            # 更新班數統計
-            if gap.is_holiday:
-                self.current_duties[doctor_name]['holiday'] += 1
-            else:
-                self.current_duties[doctor_name]['weekday'] += 1
-            self.current_duties[doctor_name]['total'] += 1
+            # 更新排班與班數統計
+            self.update_slot(gap.date, gap.role, doctor_name)
             
             # 重新分析空缺
             self.gaps = self._analyze_gaps_advanced()
@@ -1162,10 +1138,10 @@ class Stage2AdvancedSwapper:
     def _save_state(self):
         """保存當前狀態"""
         state = BacktrackState(
-            schedule=copy.deepcopy(self.schedule),
-            current_duties=copy.deepcopy(self.current_duties),
-            gaps=copy.deepcopy(self.gaps),
-            applied_swaps=copy.deepcopy(self.applied_swaps)
+            schedule=clone_schedule(self.schedule),
+            current_duties={name: dict(counts) for name, counts in self.current_duties.items()},
+            gaps=list(self.gaps),  # 空缺與交換鏈建立後不再修改，複製串列即可
+            applied_swaps=list(self.applied_swaps)
         )
         self.backtrack_stack.append(state)
         self.state_history.append(f"狀態保存於 {datetime.now().strftime('%H:%M:%S')}")
@@ -1175,6 +1151,7 @@ class Stage2AdvancedSwapper:
         if self.backtrack_stack:
             state = self.backtrack_stack.pop()
             self.schedule = state.schedule
+            self._invalidate_schedule_caches()
             self.current_duties = state.current_duties
             self.gaps = state.gaps
             self.applied_swaps = state.applied_swaps
@@ -1200,9 +1177,8 @@ class Stage2AdvancedSwapper:
         """取得詳細報告"""
         total_slots = len(self.schedule) * 2
         filled_slots = sum(
-            1 for slot in self.schedule.values()
-            for attr in [slot.attending, slot.resident]
-            if attr
+            bool(slot.attending) + bool(slot.resident)
+            for slot in self.schedule.values()
         )
         
         # 空缺分類
@@ -1319,7 +1295,7 @@ class Stage2AdvancedSwapper:
         
         # 檢查配額
         current = self.current_duties[doctor.name]
-        is_holiday = date in self.holidays
+        is_holiday = date in self.holiday_set
         
         if is_holiday:
             if current['holiday'] >= doctor.holiday_quota:
@@ -1333,19 +1309,65 @@ class Stage2AdvancedSwapper:
             reasons.append(f"超過連續值班上限({self.constraints.max_consecutive_days}天)")
         
         # 檢查不可值班日
-        if date in doctor.unavailable_dates:
+        if date in self.doctor_unavailable[doctor.name]:
             reasons.append("不可值班日")
         
         # 檢查是否已在同一天有班
         slot = self.schedule.get(date)
-        if slot and doctor.name in [slot.attending, slot.resident]:
+        if slot and (slot.attending == doctor.name or slot.resident == doctor.name):
             reasons.append("同日已有其他班次")
         
         return " / ".join(reasons) if reasons else "未知原因"
 
     def _would_violate_consecutive(self, doctor_name: str, date: str) -> bool:
-        """檢查是否會違反連續值班限制"""
-        return check_consecutive_days(
-            self.schedule, doctor_name, date, 
-            self.constraints.max_consecutive_days
-        )
\ No newline at end of file
+        """檢查是否會違反連續值班限制（同一排班表狀態下結果會被快取）"""
+        key = (doctor_name, date)
+        result = self._consecutive_cache.get(key)
+        if result is None:
+            neighbors = self._consecutive_neighbors.get(date)
+            if neighbors is None:
+                result = check_consecutive_days(
+                    self.schedule, doctor_name, date,
+                    self.constraints.max_consecutive_days
+                )
+            else:
+                # 與 check_consecutive_days 相同：往前、往後各看 max_consecutive_days - 1 天，
+                # 不在排班表中的日期略過
+                consecutive_count = 1
+                for side in neighbors:
+                    for check_date in side:
+                        slot = self.schedule.get(check_date)
+                        if slot is None:
+                            continue
+                        if slot.attending == doctor_name or slot.resident == doctor_name:
+                            consecutive_count += 1
+                        else:
+                            break
+                result = consecutive_count > self.constraints.max_consecutive_days
+            self._consecutive_cache[key] = result
+        return result
+    
+    def _invalidate_schedule_caches(self):
+        """排班表變動後清空連續值班檢查快取、班次索引與可交換班次快取"""
+        self._consecutive_cache.clear()
+        self._shift_index = None
+        self._swappable_cache.clear()
+    
+    def _get_doctor_shifts(self, doctor: Doctor) -> List[Tuple[str, str]]:
+        """取得醫師以本身角色值的班次（依排班表順序）
+        
+        交換鏈搜尋會對每位候選醫師反覆查詢，索引一次掃描排班表建立，排班表變動前沿用
+        """
+        if self._shift_index is None:
+            index = {}
+            for date_str, slot in self.schedule.items():
+                if slot.attending:
+                    index.setdefault(slot.attending, []).append((date_str, "主治"))
+                if slot.resident:
+                    index.setdefault(slot.resident, []).append((date_str, "總醫師"))
+            self._shift_index = index
+        
+        return [
+            (date_str, role) for date_str, role in self._shift_index.get(doctor.name, ())
+            if role == doctor.role
+        ]
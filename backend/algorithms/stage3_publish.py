@@ -3,6 +3,7 @@ Stage 3: 確認與發佈
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 from typing import Dict, List, Tuple
 from dataclasses import dataclass
 from datetime import datetime
@@ -10,6 +11,10 @@ import json
 
 from backend.models import Doctor, ScheduleSlot, ScheduleQualityReport
 
+# 值班次數矩陣的欄位索引
+QUOTA_WEEKDAY = 0
+QUOTA_HOLIDAY = 1
+
 
 class Stage3Publisher:
     """Stage 3: 確認與發佈器"""
@@ -24,6 +29,30 @@ class Stage3Publisher:
         
         # 建立醫師索引
         self.doctor_map = {d.name: d for d in doctors}
+        self.holiday_set = set(holidays)
+        self.sorted_dates = sorted(schedule.keys())  # 排班表在發佈階段不再變動，排序一次即可
+        
+        # 日期 -> 偏好該日的醫師姓名（依醫師順序），備註與偏好檢查不必逐一掃描每位醫師
+        self.preferring_doctors: Dict[str, List[str]] = {}
+        for doctor in doctors:
+            for pref_date in dict.fromkeys(doctor.preferred_dates):
+                self.preferring_doctors.setdefault(pref_date, []).append(doctor.name)
+        
+        # 依日期排列的主治、總醫師編號陣列（-1 表示空格或非名單醫師）與各日的配額欄位，
+        # 配額統計以 NumPy 一次累計，不再逐格更新巢狀字典
+        self.doctor_index = {name: i for i, name in enumerate(self.doctor_map)}
+        self.attending_ids = np.array(
+            [self.doctor_index.get(self.schedule[d].attending, -1) for d in self.sorted_dates],
+            dtype=np.int32
+        )
+        self.resident_ids = np.array(
+            [self.doctor_index.get(self.schedule[d].resident, -1) for d in self.sorted_dates],
+            dtype=np.int32
+        )
+        self.quota_cols = np.array(
+            [QUOTA_HOLIDAY if d in self.holiday_set else QUOTA_WEEKDAY for d in self.sorted_dates],
+            dtype=np.int32
+        )
         
         # 生成品質報告
         self.quality_report = self._generate_quality_report()
@@ -103,7 +132,7 @@ class Stage3Publisher:
         issues = []
         doctor_consecutive = {}
         
-        sorted_dates = sorted(self.schedule.keys())
+        sorted_dates = self.sorted_dates
         
         for i, date_str in enumerate(sorted_dates):
             slot = self.schedule[date_str]
@@ -115,7 +144,7 @@ class Stage3Publisher:
                 # 檢查連續值班
                 if i > 0:
                     prev_slot = self.schedule[sorted_dates[i-1]]
-                    if doctor_name in [prev_slot.attending, prev_slot.resident]:
+                    if prev_slot.attending == doctor_name or prev_slot.resident == doctor_name:
                         if doctor_name not in doctor_consecutive:
                             doctor_consecutive[doctor_name] = 1
                         else:
@@ -146,7 +175,7 @@ class Stage3Publisher:
                     total_preferences += 1
                     slot = self.schedule[pref_date]
                     
-                    if doctor.name in [slot.attending, slot.resident]:
+                    if slot.attending == doctor.name or slot.resident == doctor.name:
                         satisfied_preferences += 1
                         result['satisfied'].append(f"{doctor.name} 在偏好日 {pref_date} 值班")
                     else:
@@ -174,8 +203,7 @@ class Stage3Publisher:
             return False
         
         # 檢查當前醫師是否也偏好這天
-        current_doc_obj = self.doctor_map.get(current_doctor)
-        if current_doc_obj and date in current_doc_obj.preferred_dates:
+        if current_doctor in self.preferring_doctors.get(date, ()):
             return False
         
         return True
@@ -184,28 +212,16 @@ class Stage3Publisher:
         """檢查配額使用情況"""
         issues = []
         
-        # 計算每個醫師的使用量
-        doctor_usage = {}
-        for doctor in self.doctors:
-            doctor_usage[doctor.name] = {'weekday': 0, 'holiday': 0}
-        
-        for date_str, slot in self.schedule.items():
-            is_holiday = date_str in self.holidays
-            quota_type = 'holiday' if is_holiday else 'weekday'
-            
-            if slot.attending and slot.attending in doctor_usage:
-                doctor_usage[slot.attending][quota_type] += 1
-            
-            if slot.resident and slot.resident in doctor_usage:
-                doctor_usage[slot.resident][quota_type] += 1
+        # 計算每個醫師的使用量（兩個角色各自計入）
+        usage = self._count_duties(self.attending_ids) + self._count_duties(self.resident_ids)
         
         # 檢查配額使用
         for doctor in self.doctors:
-            usage = doctor_usage[doctor.name]
+            weekday_used, holiday_used = usage[self.doctor_index[doctor.name]].tolist()
             
             # 檢查是否未充分使用
-            weekday_rate = usage['weekday'] / max(doctor.weekday_quota, 1)
-            holiday_rate = usage['holiday'] / max(doctor.holiday_quota, 1)
+            weekday_rate = weekday_used / max(doctor.weekday_quota, 1)
+            holiday_rate = holiday_used / max(doctor.holiday_quota, 1)
             
             if weekday_rate < 0.5:
                 issues.append(f"{doctor.name} 平日配額使用率過低 ({weekday_rate:.0%})")
@@ -225,23 +241,15 @@ class Stage3Publisher:
             'role_distribution': {'主治': 0, '總醫師': 0}
         }
         
-        # 計算每個醫師的值班統計
+        # 角色分布與每個醫師的值班數（同一天兼任兩個角色只算一班）
+        stats['role_distribution']['主治'] = int(np.count_nonzero(self.attending_ids >= 0))
+        stats['role_distribution']['總醫師'] = int(np.count_nonzero(self.resident_ids >= 0))
+        
+        resident_only = np.where(self.resident_ids != self.attending_ids, self.resident_ids, -1)
+        counts = self._count_duties(self.attending_ids) + self._count_duties(resident_only)
+        
         for doctor in self.doctors:
-            weekday_count = 0
-            holiday_count = 0
-            
-            for date_str, slot in self.schedule.items():
-                if doctor.name in [slot.attending, slot.resident]:
-                    if date_str in self.holidays:
-                        holiday_count += 1
-                    else:
-                        weekday_count += 1
-                
-                # 統計角色分布
-                if slot.attending == doctor.name:
-                    stats['role_distribution']['主治'] += 1
-                if slot.resident == doctor.name:
-                    stats['role_distribution']['總醫師'] += 1
+            weekday_count, holiday_count = counts[self.doctor_index[doctor.name]].tolist()
             
             stats['doctor_duties'][doctor.name] = {
                 'weekday': weekday_count,
@@ -253,15 +261,21 @@ class Stage3Publisher:
         
         return stats
     
+    def _count_duties(self, doctor_ids: np.ndarray) -> np.ndarray:
+        """累計各醫師的平日、假日值班數，回傳 (醫師數, 2) 矩陣（-1 的格位略過）"""
+        filled = doctor_ids >= 0
+        flat = doctor_ids[filled] * 2 + self.quota_cols[filled]
+        return np.bincount(flat, minlength=len(self.doctor_index) * 2).reshape(-1, 2)
+    
     def export_to_dataframe(self) -> pd.DataFrame:
         """匯出為 DataFrame"""
         data = []
         
-        for date_str in sorted(self.schedule.keys()):
+        for date_str in self.sorted_dates:
             slot = self.schedule[date_str]
             
             # 判斷是否為假日
-            is_holiday = date_str in self.holidays
+            is_holiday = date_str in self.holiday_set
             
             # 取得星期幾
             date_obj = datetime.strptime(date_str, "%Y-%m-%d")
@@ -284,13 +298,12 @@ class Stage3Publisher:
         notes = []
         
         # 檢查是否有人在偏好日值班
-        for doctor in self.doctors:
-            if date_str in doctor.preferred_dates:
-                if doctor.name in [slot.attending, slot.resident]:
-                    notes.append(f"{doctor.name}偏好")
+        for name in self.preferring_doctors.get(date_str, ()):
+            if slot.attending == name or slot.resident == name:
+                notes.append(f"{name}偏好")
         
         # 檢查是否為重要假日
-        if date_str in self.holidays:
+        if date_str in self.holiday_set:
             date_obj = datetime.strptime(date_str, "%Y-%m-%d")
             if date_obj.weekday() in [5, 6]:  # 週末
                 notes.append("週末假日")
@@ -26,6 +26,13 @@ class ComplexityAnalyzer:
         attending_doctors = [d for d in doctors if d.role == "主治"]
         resident_doctors = [d for d in doctors if d.role == "總醫師"]
         
+        # 逐天可值班人數（平日在前、假日在後），由可值班矩陣一次算出
+        all_dates_ordered = weekdays + holidays
+        daily_available = (
+            self._build_availability_matrix(attending_doctors, all_dates_ordered).sum(axis=0).tolist(),
+            self._build_availability_matrix(resident_doctors, all_dates_ordered).sum(axis=0).tolist()
+        )
+        
         # 1. 計算分角色的供需比
         supply_demand = self._calculate_role_based_supply_demand(
             attending_doctors, resident_doctors, weekdays, holidays
@@ -38,7 +45,8 @@ class ComplexityAnalyzer:
         
         # 3. 計算逐天搜索空間
         search_space = self._calculate_daily_search_space(
-            attending_doctors, resident_doctors, weekdays, holidays, all_dates
+            attending_doctors, resident_doctors, weekdays, holidays, all_dates,
+            daily_available
         )
         
         # 4. 評估難度（相對化閾值）
@@ -48,7 +56,8 @@ class ComplexityAnalyzer:
         
         # 5. 精確可行性檢查
         feasibility = self._check_detailed_feasibility(
-            attending_doctors, resident_doctors, weekdays, holidays, all_dates
+            attending_doctors, resident_doctors, weekdays, holidays, all_dates,
+            daily_available
         )
         
         # 6. 智慧瓶頸偵測
@@ -88,6 +97,18 @@ class ComplexityAnalyzer:
             'bottlenecks': bottlenecks
         }
     
+    def _build_availability_matrix(self, doctors: List[Doctor],
+                                   dates: List[str]) -> np.ndarray:
+        """建立 (醫師數, 日期數) 的可值班布林矩陣（不可值班日為 False）"""
+        matrix = np.ones((len(doctors), len(dates)), dtype=np.bool_)
+        date_columns = defaultdict(list)
+        for i, date in enumerate(dates):
+            date_columns[date].append(i)
+        for row, doctor in enumerate(doctors):
+            cols = [i for d in set(doctor.unavailable_dates) for i in date_columns.get(d, ())]
+            matrix[row, cols] = False
+        return matrix
+    
     def _calculate_role_based_supply_demand(self, attending: List[Doctor], 
                                            resident: List[Doctor],
                                            weekdays: List[str], 
@@ -127,20 +148,12 @@ class ComplexityAnalyzer:
         if not doctors or not all_dates:
             return {'density': 0, 'max_personal_conflict': 0}
         
-        # 只計算當月的不可值班日
-        monthly_conflicts = []
-        for doctor in doctors:
-            # 交集：該醫師的不可值班日與當月日期
-            doctor_monthly_unavailable = set(doctor.unavailable_dates) & all_dates
-            conflict_ratio = len(doctor_monthly_unavailable) / len(all_dates)
-            monthly_conflicts.append(conflict_ratio)
+        # 只計算當月的不可值班日（交集：該醫師的不可值班日與當月日期，每位醫師只算一次）
+        monthly_unavailable = [len(all_dates.intersection(d.unavailable_dates)) for d in doctors]
+        monthly_conflicts = [count / len(all_dates) for count in monthly_unavailable]
         
         # 整體密度
-        total_unavailable = sum(
-            len(set(d.unavailable_dates) & all_dates) 
-            for d in doctors
-        )
-        density = total_unavailable / (len(doctors) * len(all_dates))
+        density = sum(monthly_unavailable) / (len(doctors) * len(all_dates))
         
         return {
             'density': density,
@@ -152,26 +165,15 @@ class ComplexityAnalyzer:
                                      resident: List[Doctor],
                                      weekdays: List[str], 
                                      holidays: List[str],
-                                     all_dates: Set[str]) -> Dict:
+                                     all_dates: Set[str],
+                                     daily_available: Tuple[List[int], List[int]]) -> Dict:
         """計算逐天搜索空間"""
         daily_options = []
         daily_log_space = []
         hardest_days = []
         
-        for date in weekdays + holidays:
-            # 計算當天可值班的醫師數（考慮不可值班日）
-            available_attending = [
-                d for d in attending 
-                if date not in d.unavailable_dates
-            ]
-            available_resident = [
-                d for d in resident 
-                if date not in d.unavailable_dates
-            ]
-            
-            a_count = len(available_attending)
-            r_count = len(available_resident)
-            
+        # 當天可值班的醫師數（考慮不可值班日）
+        for date, a_count, r_count in zip(weekdays + holidays, *daily_available):
             # 當天的總選項數
             day_options = a_count * r_count if a_count > 0 and r_count > 0 else 0
             daily_options.append(day_options)
@@ -270,7 +272,8 @@ class ComplexityAnalyzer:
                                    resident: List[Doctor],
                                    weekdays: List[str], 
                                    holidays: List[str],
-                                   all_dates: Set[str]) -> Dict:
+                                   all_dates: Set[str],
+                                   daily_available: Tuple[List[int], List[int]]) -> Dict:
         """精確可行性檢查"""
         results = {
             'overall': True,
@@ -303,21 +306,14 @@ class ComplexityAnalyzer:
             results['holiday_resident'] = False
             results['overall'] = False
         
-        # 檢查逐天可行性
-        for date in weekdays + holidays:
-            available_attending = sum(
-                1 for d in attending 
-                if date not in d.unavailable_dates
-            )
-            available_resident = sum(
-                1 for d in resident 
-                if date not in d.unavailable_dates
-            )
-            
+        # 檢查逐天可行性（平日判斷改查集合，不必逐日線性搜尋平日列表）
+        weekday_set = frozenset(weekdays)
+        for date, available_attending, available_resident in zip(weekdays + holidays,
+                                                                 *daily_available):
             if available_attending == 0 or available_resident == 0:
                 results['daily_gaps'].append({
                     'date': date,
-                    'type': '平日' if date in weekdays else '假日',
+                    'type': '平日' if date in weekday_set else '假日',
                     'attending': available_attending,
                     'resident': available_resident
                 })
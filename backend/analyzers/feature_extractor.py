@@ -1,7 +1,7 @@
 """
 特徵提取器
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 from collections import defaultdict
 from datetime import datetime
 import numpy as np
@@ -21,9 +21,8 @@ class FeatureExtractor:
         # 基礎統計
         total_slots = len(schedule) * 2  # 每天2個角色
         filled_slots = sum(
-            1 for slot in schedule.values() 
-            for val in [slot.attending, slot.resident] 
-            if val
+            bool(slot.attending) + bool(slot.resident)
+            for slot in schedule.values()
         )
         unfilled_slots = total_slots - filled_slots
         fill_rate = filled_slots / total_slots if total_slots > 0 else 0
@@ -33,6 +32,16 @@ class FeatureExtractor:
         weekday_duties = defaultdict(int)
         holiday_duties = defaultdict(int)
         
+        # 醫師索引與日期集合（同名時沿用第一位醫師）
+        doctor_map = {}
+        for doc in doctors:
+            doctor_map.setdefault(doc.name, doc)
+        unavailable_sets = {name: frozenset(doc.unavailable_dates)
+                            for name, doc in doctor_map.items()}
+        preferred_sets = {name: frozenset(doc.preferred_dates)
+                          for name, doc in doctor_map.items()}
+        holiday_set = frozenset(holidays)
+        
         # 違規統計
         hard_violations = 0
         unavailable_violations = 0
@@ -43,7 +52,7 @@ class FeatureExtractor:
         
         # 遍歷排班
         for date_str, slot in schedule.items():
-            is_holiday = date_str in holidays
+            is_holiday = date_str in holiday_set
             
             # 處理主治醫師
             if slot.attending:
@@ -54,12 +63,12 @@ class FeatureExtractor:
                     weekday_duties[slot.attending] += 1
                 
                 # 檢查違規和偏好
-                doc = next((d for d in doctors if d.name == slot.attending), None)
+                doc = doctor_map.get(slot.attending)
                 if doc:
-                    if date_str in doc.unavailable_dates:
+                    if date_str in unavailable_sets[doc.name]:
                         unavailable_violations += 1
                         hard_violations += 1
-                    if date_str in doc.preferred_dates:
+                    if date_str in preferred_sets[doc.name]:
                         preference_hits += 1
                     total_preferences += len(doc.preferred_dates)
             
@@ -71,12 +80,12 @@ class FeatureExtractor:
                 else:
                     weekday_duties[slot.resident] += 1
                 
-                doc = next((d for d in doctors if d.name == slot.resident), None)
+                doc = doctor_map.get(slot.resident)
                 if doc:
-                    if date_str in doc.unavailable_dates:
+                    if date_str in unavailable_sets[doc.name]:
                         unavailable_violations += 1
                         hard_violations += 1
-                    if date_str in doc.preferred_dates:
+                    if date_str in preferred_sets[doc.name]:
                         preference_hits += 1
                     total_preferences += len(doc.preferred_dates)
         
@@ -89,8 +98,9 @@ class FeatureExtractor:
                 quota_violations += holiday_duties[doc.name] - doc.holiday_quota
                 hard_violations += quota_violations
         
-        # 計算連續值班
-        consecutive_days = self._calculate_consecutive_days(schedule, doctors)
+        # 計算連續值班（日期只排序一次，與孤立值班共用）
+        sorted_dates = sorted(schedule)
+        consecutive_days = self._calculate_consecutive_days(schedule, doctors, sorted_dates)
         avg_consecutive = np.mean(consecutive_days) if consecutive_days else 0
         max_consecutive = max(consecutive_days) if consecutive_days else 0
         consecutive_violations = sum(1 for c in consecutive_days 
@@ -105,19 +115,17 @@ class FeatureExtractor:
         
         # 覆蓋率
         weekend_filled = sum(
-            1 for date_str in holidays 
-            if date_str in schedule 
-            for val in [schedule[date_str].attending, schedule[date_str].resident]
-            if val
+            bool(schedule[date_str].attending) + bool(schedule[date_str].resident)
+            for date_str in holidays
+            if date_str in schedule
         )
         weekend_total = len(holidays) * 2
         weekend_coverage = weekend_filled / weekend_total if weekend_total > 0 else 0
         
         weekday_filled = sum(
-            1 for date_str in weekdays 
-            if date_str in schedule 
-            for val in [schedule[date_str].attending, schedule[date_str].resident]
-            if val
+            bool(schedule[date_str].attending) + bool(schedule[date_str].resident)
+            for date_str in weekdays
+            if date_str in schedule
         )
         weekday_total = len(weekdays) * 2
         weekday_coverage = weekday_filled / weekday_total if weekday_total > 0 else 0
@@ -133,7 +141,7 @@ class FeatureExtractor:
         cross_balance = abs(avg_attending - avg_resident) / max(avg_attending, avg_resident, 1)
         
         # 計算孤立值班
-        isolated_count = self._count_isolated_duties(schedule)
+        isolated_count = self._count_isolated_duties(schedule, sorted_dates)
         
         return SolutionFeatures(
             total_slots=total_slots,
@@ -164,25 +172,37 @@ class FeatureExtractor:
         )
     
     def _calculate_consecutive_days(self, schedule: Dict[str, ScheduleSlot], 
-                                   doctors: List[Doctor]) -> List[int]:
-        """計算每個醫師的連續值班天數"""
+                                   doctors: List[Doctor],
+                                   sorted_dates: Optional[List[str]] = None) -> List[int]:
+        """計算每個醫師的連續值班天數（sorted_dates 為呼叫端已排序的日期）"""
         consecutive_list = []
         
+        # 日期排序與醫師無關，迴圈外只做一次
+        if sorted_dates is None:
+            sorted_dates = sorted(schedule)
+        sorted_slots = [(date_str, schedule[date_str]) for date_str in sorted_dates]
+        # 日期 -> 序數，跨醫師共用；只解析名單內醫師需要比較前後日的值班日期
+        day_numbers = {}
+        
         for doc in doctors:
-            dates = sorted([
-                date_str for date_str, slot in schedule.items()
+            dates = [
+                date_str for date_str, slot in sorted_slots
                 if slot.attending == doc.name or slot.resident == doc.name
-            ])
+            ]
             
             if not dates:
                 continue
             
+            if len(dates) > 1:
+                for i, date_str in enumerate(dates):
+                    day = day_numbers.get(date_str)
+                    if day is None:
+                        day = day_numbers[date_str] = datetime.strptime(date_str, "%Y-%m-%d").toordinal()
+                    dates[i] = day
+            
             current_streak = 1
             for i in range(1, len(dates)):
-                curr_date = datetime.strptime(dates[i], "%Y-%m-%d")
-                prev_date = datetime.strptime(dates[i-1], "%Y-%m-%d")
-                
-                if (curr_date - prev_date).days == 1:
+                if dates[i] - dates[i-1] == 1:
                     current_streak += 1
                 else:
                     consecutive_list.append(current_streak)
@@ -203,29 +223,32 @@ class FeatureExtractor:
         
         return (2 * np.sum((np.arange(1, n+1)) * sorted_values)) / (n * np.sum(sorted_values)) - (n + 1) / n
     
-    def _count_isolated_duties(self, schedule: Dict[str, ScheduleSlot]) -> int:
+    def _count_isolated_duties(self, schedule: Dict[str, ScheduleSlot],
+                               sorted_dates: Optional[List[str]] = None) -> int:
         """計算孤立值班數（前後都沒班）"""
         isolated = 0
-        sorted_dates = sorted(schedule.keys())
+        if sorted_dates is None:
+            sorted_dates = sorted(schedule)
+        # 依日期排列的格位，前後一天直接以索引取得
+        slots = [schedule[date_str] for date_str in sorted_dates]
         
-        for i, date_str in enumerate(sorted_dates):
-            slot = schedule[date_str]
+        for i, slot in enumerate(slots):
             
-            for doctor_name in [slot.attending, slot.resident]:
+            for doctor_name in (slot.attending, slot.resident):
                 if not doctor_name:
                     continue
                 
                 # 檢查前一天
                 has_prev = False
                 if i > 0:
-                    prev_slot = schedule[sorted_dates[i-1]]
+                    prev_slot = slots[i-1]
                     if prev_slot.attending == doctor_name or prev_slot.resident == doctor_name:
                         has_prev = True
                 
                 # 檢查後一天
                 has_next = False
-                if i < len(sorted_dates) - 1:
-                    next_slot = schedule[sorted_dates[i+1]]
+                if i < len(slots) - 1:
+                    next_slot = slots[i+1]
                     if next_slot.attending == doctor_name or next_slot.resident == doctor_name:
                         has_next = True
                 
@@ -3,7 +3,6 @@
 """
 from typing import Dict, Tuple, List
 from collections import defaultdict
-import numpy as np
 
 from ..models import Doctor, ScheduleSlot
 
@@ -15,6 +14,13 @@ class ScheduleScorer:
         self.weekdays = weekdays
         self.holidays = holidays
         self.doctor_map = {d.name: d for d in doctors}
+        
+        # 預先建立集合，逐格檢查時以 O(1) 查詢取代串列搜尋
+        self.holiday_set = frozenset(holidays)
+        self.doctor_unavailable = {name: frozenset(doc.unavailable_dates)
+                                   for name, doc in self.doctor_map.items()}
+        self.doctor_preferred = {name: frozenset(doc.preferred_dates)
+                                 for name, doc in self.doctor_map.items()}
     
     def calculate_score(self, schedule: Dict[str, ScheduleSlot]) -> float:
         """
@@ -65,7 +71,7 @@ class ScheduleScorer:
         holiday_counts = defaultdict(int)
         
         for date_str, slot in schedule.items():
-            is_holiday = date_str in self.holidays
+            is_holiday = date_str in self.holiday_set
             
             # 統計值班次數
             if slot.attending:
@@ -76,11 +82,10 @@ class ScheduleScorer:
                     weekday_counts[slot.attending] += 1
                     
                 # 檢查違規
-                doc = self.doctor_map.get(slot.attending)
-                if doc:
-                    if date_str in doc.unavailable_dates:
+                if slot.attending in self.doctor_map:
+                    if date_str in self.doctor_unavailable[slot.attending]:
                         stats['hard_violations'] += 1
-                    if date_str in doc.preferred_dates:
+                    if date_str in self.doctor_preferred[slot.attending]:
                         stats['preference_hits'] += 1
                     
             if slot.resident:
@@ -90,11 +95,10 @@ class ScheduleScorer:
                 else:
                     weekday_counts[slot.resident] += 1
                     
-                doc = self.doctor_map.get(slot.resident)
-                if doc:
-                    if date_str in doc.unavailable_dates:
+                if slot.resident in self.doctor_map:
+                    if date_str in self.doctor_unavailable[slot.resident]:
                         stats['hard_violations'] += 1
-                    if date_str in doc.preferred_dates:
+                    if date_str in self.doctor_preferred[slot.resident]:
                         stats['preference_hits'] += 1
         
         # 檢查配額違規
@@ -105,10 +109,12 @@ class ScheduleScorer:
                 stats['hard_violations'] += (holiday_counts[name] - doc.holiday_quota)
         
         # 計算公平性（使用標準差的反向值）
+        # 醫師數僅數十人，直接由總和與平方和求標準差，不必為小串列建立 ndarray
         if duty_counts:
-            values = list(duty_counts.values())
-            mean_duty = np.mean(values)
-            std_duty = np.std(values)
+            values = duty_counts.values()
+            n = len(duty_counts)
+            mean_duty = sum(values) / n
+            std_duty = max(0.0, sum(v * v for v in values) / n - mean_duty * mean_duty) ** 0.5
             stats['fairness'] = max(0, 10 - std_duty)  # 標準差越小，公平性越高
         
         stats['duty_counts'] = dict(duty_counts)
@@ -1,7 +1,6 @@
 """
 解池管理器
 """
-import copy
 import time
 import json
 from datetime import datetime
@@ -10,7 +9,7 @@ from collections import Counter
 import pandas as pd
 import numpy as np
 
-from ..models import Doctor, ScheduleSlot, ScheduleConstraints, SolutionRecord
+from ..models import Doctor, ScheduleSlot, ScheduleConstraints, SolutionRecord, clone_schedule
 from ..analyzers import FeatureExtractor, GradingSystem
 
 class SolutionPoolManager:
@@ -18,6 +17,8 @@ class SolutionPoolManager:
     
     def __init__(self):
         self.solution_pool: List[SolutionRecord] = []
+        # 解 ID -> 排班內容指紋（加入解池時計算一次，多樣性統計直接以集合去重）
+        self._fingerprints: Dict[str, tuple] = {}
         self.feature_extractor = FeatureExtractor()
         self.grading_system = GradingSystem()
         
@@ -43,7 +44,7 @@ class SolutionPoolManager:
         record = SolutionRecord(
             solution_id=solution_id,
             timestamp=datetime.now().isoformat(),
-            schedule=copy.deepcopy(schedule),
+            schedule=clone_schedule(schedule),
             score=score,
             features=features,
             grade=grade,
@@ -53,8 +54,16 @@ class SolutionPoolManager:
         )
         
         self.solution_pool.append(record)
+        self._fingerprints[solution_id] = self._schedule_fingerprint(record.schedule)
         return solution_id
     
+    @staticmethod
+    def _schedule_fingerprint(schedule: Dict[str, ScheduleSlot]) -> tuple:
+        """排班內容的指紋：依日期排序的 (日期, 主治, 總醫師)，內容相同即相等"""
+        return tuple(sorted(
+            (date, slot.attending, slot.resident) for date, slot in schedule.items()
+        ))
+    
     def get_top_solutions(self, n: int = 10) -> List[SolutionRecord]:
         """獲取最佳的n個解"""
         sorted_pool = sorted(self.solution_pool, key=lambda x: x.score, reverse=True)
@@ -105,11 +114,8 @@ class SolutionPoolManager:
             'score_std': np.std([s.score for s in self.solution_pool]),
             'grade_distribution': dict(grade_dist),
             'feature_diversity': np.mean(cv),
-            'unique_schedules': len(set(
-                tuple(sorted(
-                    (date, (slot.attending, slot.resident))
-                    for date, slot in s.schedule.items()
-                )) 
+            'unique_schedules': len({
+                self._fingerprints.get(s.solution_id) or self._schedule_fingerprint(s.schedule)
                 for s in self.solution_pool
-            ))
+            })
         }
\ No newline at end of file
@@ -10,7 +10,8 @@ from .schedule import (
     ScheduleResult, 
     ScheduleConstraints, 
     SchedulingState, 
-    ScheduleQualityReport
+    ScheduleQualityReport,
+    clone_schedule
 )
 
 # 最後導入依賴 schedule 的模型
@@ -23,6 +24,7 @@ __all__ = [
     'ScheduleConstraints',
     'SchedulingState',
     'ScheduleQualityReport',
+    'clone_schedule',
     'SolutionFeatures',
     'SolutionRecord'
 ]
\ No newline at end of file
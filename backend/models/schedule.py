@@ -1,7 +1,7 @@
 """
 排班相關資料模型
 """
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import Dict, List, Tuple, Optional, Any
 
 @dataclass
@@ -9,12 +9,13 @@ class ScheduleConstraints:
     """排班限制條件"""
     max_consecutive_days: int = 2  # 最大連續值班天數
     beam_width: int = 5  # 束搜索寬度
+    branching_factor: int = 3  # 束搜索每個狀態展開的候選數
     csp_timeout: int = 10  # CSP求解超時（秒）
     neighbor_expansion: int = 10  # 鄰域展開上限
 
-@dataclass
+@dataclass(slots=True)
 class ScheduleSlot:
-    """排班格位"""
+    """排班格位（大量建立的小物件，以 __slots__ 省去實例字典）"""
     date: str
     attending: Optional[str] = None  # 主治醫師
     resident: Optional[str] = None   # 住院醫師
@@ -27,19 +28,45 @@ class ScheduleSlot:
         """檢查是否完全空白"""
         return self.attending is None and self.resident is None
     
-@dataclass
+    def copy(self) -> 'ScheduleSlot':
+        """複製格位
+        
+        各欄位只存字串或 None（不可變），淺層複製即與 deepcopy 等價；
+        以 dataclasses.replace 複製，格位日後新增欄位也會一併帶入
+        """
+        return replace(self)
+
+def clone_schedule(schedule: Dict[str, ScheduleSlot]) -> Dict[str, ScheduleSlot]:
+    """複製排班表（逐格呼叫 ScheduleSlot.copy，取代 copy.deepcopy）"""
+    return {date_str: slot.copy() for date_str, slot in schedule.items()}
+    
+@dataclass(slots=True)
 class SchedulingState:
-    """排班狀態"""
-    schedule: Dict[str, ScheduleSlot]
+    """排班狀態（Beam Search 每步大量建立，以 __slots__ 省去實例字典）"""
+    schedule: Optional[Dict[str, ScheduleSlot]]  # Stage 1 Beam Search 中間狀態為 None
     score: float
     filled_count: int
     unfilled_slots: List[Tuple[str, str]]  # (date, role)
     parent_id: Optional[str] = None
     generation_method: str = "greedy_beam"
+
+    # 增量計分用的統計（Beam Search 展開時沿用父狀態並局部更新）
+    used_quota: Any = None  # Stage 1 使用 np.ndarray (醫師數, 2)：平日、假日
+    quota_balance: float = 0.0
+    usage_sum: int = 0    # 各醫師配額使用率（整數單位）的總和與平方和（均衡度標準差的增量計算）
+    usage_sqsum: int = 0
+    preference_satisfied: int = 0
+    holiday_filled: int = 0
+    consecutive_penalty: float = 0.0
     
+    # Stage 1 內部以日期索引的醫師編號陣列表示排班（-1 為空格），schedule 為對外介面
+    attending_ids: Any = None
+    resident_ids: Any = None
+
     @property
     def fill_rate(self) -> float:
-        total = len(self.schedule) * 2  # 每天2個位置
+        num_dates = len(self.schedule) if self.schedule is not None else len(self.attending_ids)
+        total = num_dates * 2  # 每天2個位置
         return self.filled_count / total if total > 0 else 0
     
 @dataclass 
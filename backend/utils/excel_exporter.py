@@ -24,6 +24,7 @@ class ExcelCalendarExporter:
         self.doctors = doctors
         self.weekdays = weekdays
         self.holidays = holidays
+        self.holiday_set = frozenset(holidays)  # 逐日判斷假日用，避免掃描 list
         self.year = year
         self.month = month
         
@@ -139,7 +140,7 @@ class ExcelCalendarExporter:
                     cell = ws.cell(row=current_row, column=day_of_week)
                     
                     # 判斷日期類型並設定背景色
-                    if date_str in self.holidays:
+                    if date_str in self.holiday_set:
                         cell.fill = self.styles['holiday_cell']['fill']
                     elif day_of_week in [6, 7]:  # 週末
                         cell.fill = self.styles['weekend_cell']['fill']
@@ -214,7 +215,7 @@ class ExcelCalendarExporter:
         
         # 計算統計
         for date_str, slot in self.schedule.items():
-            is_holiday = date_str in self.holidays
+            is_holiday = date_str in self.holiday_set
             
             if slot.attending and slot.attending in doctor_stats:
                 if is_holiday:
@@ -32,6 +32,7 @@ class PDFCalendarGenerator:
         self.doctors = doctors
         self.weekdays = weekdays
         self.holidays = holidays
+        self.holiday_set = frozenset(holidays)  # 逐日判斷假日用，避免掃描 list
         self.year = year
         self.month = month
         
@@ -228,7 +229,7 @@ class PDFCalendarGenerator:
                     date_str = f"{self.year:04d}-{self.month:02d}-{day:02d}"
                     
                     # 假日背景色
-                    if date_str in self.holidays:
+                    if date_str in self.holiday_set:
                         style.add('BACKGROUND', (day_idx, week_idx), (day_idx, week_idx), 
                                  colors.HexColor('#ffe6e6'))
                     # 週末背景色
@@ -267,7 +268,7 @@ class PDFCalendarGenerator:
             }
         
         for date_str, slot in self.schedule.items():
-            is_holiday = date_str in self.holidays
+            is_holiday = date_str in self.holiday_set
             
             if slot.attending and slot.attending in doctor_stats:
                 if is_holiday:
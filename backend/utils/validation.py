@@ -265,6 +265,20 @@ def check_date_availability(doctors: List, weekdays: List[str], holidays: List[s
     problems = []
     all_dates = weekdays + holidays
     
+    # 不可值班日與日期無關，先整理成集合：完整日期字串與日期數字（整數或純數字字串）
+    doctor_blocks = []
+    for doctor in doctors:
+        blocked_strs = set()
+        blocked_days = set()
+        for unavail_date in doctor.unavailable_dates:
+            if isinstance(unavail_date, int):
+                blocked_days.add(unavail_date)
+            elif isinstance(unavail_date, str):
+                blocked_strs.add(unavail_date)
+                if unavail_date.isdigit():
+                    blocked_days.add(int(unavail_date))
+        doctor_blocks.append((doctor, blocked_strs, blocked_days))
+    
     for date_str in all_dates:
         # 從日期字串提取日期資訊
         try:
@@ -284,39 +298,18 @@ def check_date_availability(doctors: List, weekdays: List[str], holidays: List[s
             year = None
             month = None
         
-        # 計算該日期可用的醫師
+        # 計算該日期可用的醫師（每位醫師只需兩次集合查詢）
         available_attending = []
         available_resident = []
         
-        for doctor in doctors:
-            is_available = True
-            
-            # 檢查不可值班日期（支援多種格式）
-            for unavail_date in doctor.unavailable_dates:
-                # 比較日期
-                if isinstance(unavail_date, int):
-                    # 如果不可值班日期是整數，比較日期數字
-                    if day and unavail_date == day:
-                        is_available = False
-                        break
-                elif isinstance(unavail_date, str):
-                    # 如果是字串，可能是完整日期或數字
-                    if unavail_date == date_str:
-                        is_available = False
-                        break
-                    elif unavail_date.isdigit() and day:
-                        if int(unavail_date) == day:
-                            is_available = False
-                            break
-                    elif "-" in unavail_date and date_str == unavail_date:
-                        is_available = False
-                        break
+        for doctor, blocked_strs, blocked_days in doctor_blocks:
+            if date_str in blocked_strs or (day and day in blocked_days):
+                continue
             
-            if is_available:
-                if doctor.role == "主治":
-                    available_attending.append(doctor.name)
-                else:
-                    available_resident.append(doctor.name)
+            if doctor.role == "主治":
+                available_attending.append(doctor.name)
+            else:
+                available_resident.append(doctor.name)
         
         # 檢查是否有足夠的醫師
         if len(available_attending) == 0:
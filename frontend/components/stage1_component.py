@@ -181,6 +181,16 @@ def execute_stage1(weekdays: list, holidays: list):
         holidays=holidays,
     )
 
+    def show_log(message: str, level: str):
+        if level == "success":
+            st.success(message)
+        elif level == "info":
+            st.info(message)
+        else:
+            st.write(message)
+
+    scheduler.set_log_callback(show_log)
+
     with st.spinner("🤖 智慧排班系統正在運作中，請稍候..."):
         results = scheduler.run(
             beam_width=10,  # 固定使用最佳參數
@@ -546,9 +546,15 @@ def render_final_output_content(swapper, weekdays: list, holidays: list):
                         
                         # 即時更新（如果有變更）
                         if new_attending != current_attending:
-                            slot.attending = None if new_attending == "（空缺）" else new_attending
+                            swapper.update_slot(
+                                date_str, "主治",
+                                None if new_attending == "（空缺）" else new_attending
+                            )
                         if new_resident != current_resident:
-                            slot.resident = None if new_resident == "（空缺）" else new_resident
+                            swapper.update_slot(
+                                date_str, "總醫師",
+                                None if new_resident == "（空缺）" else new_resident
+                            )
     
     # 顯示圖例
     st.markdown("""
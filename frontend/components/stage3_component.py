@@ -639,11 +639,12 @@ def render_doctor_view(publisher, weekdays, holidays):
         duty_dates = []
         weekday_count = 0
         holiday_count = 0
+        holiday_set = set(holidays)
         
         for date_str, slot in publisher.schedule.items():
-            if selected_doctor in [slot.attending, slot.resident]:
+            if slot.attending == selected_doctor or slot.resident == selected_doctor:
                 duty_dates.append(date_str)
-                if date_str in holidays:
+                if date_str in holiday_set:
                     holiday_count += 1
                 else:
                     weekday_count += 1
@@ -674,7 +675,7 @@ def render_doctor_view(publisher, weekdays, holidays):
                 duty_data.append({
                     '日期': date_str,
                     '星期': weekday_names[date_obj.weekday()],
-                    '類型': '假日' if date_str in holidays else '平日',
+                    '類型': '假日' if date_str in holiday_set else '平日',
                     '職責': '主治' if slot.attending == selected_doctor else '總醫師',
                     '搭檔': slot.resident if slot.attending == selected_doctor else slot.attending
                 })
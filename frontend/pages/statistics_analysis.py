@@ -163,6 +163,7 @@ def render_quota_usage(result):
     
     # 計算每個醫師的平日/假日班數
     doctor_stats = []
+    holiday_set = set(holidays)  # 醫師 × 日期的迴圈中改查集合
     
     for doc in st.session_state.doctors:
         weekday_count = 0
@@ -170,7 +171,7 @@ def render_quota_usage(result):
         
         for date_str, slot in result.schedule.items():
             if slot.attending == doc.name or slot.resident == doc.name:
-                if date_str in holidays:
+                if date_str in holiday_set:
                     holiday_count += 1
                 else:
                     weekday_count += 1
@@ -206,13 +207,14 @@ def render_unfilled_analysis(result):
         unfilled_by_date[date_str].append(role)
     
     unfilled_summary = []
+    holiday_set = set(holidays)
     for date_str, roles in unfilled_by_date.items():
         dt = datetime.strptime(date_str, "%Y-%m-%d")
         unfilled_summary.append({
             '日期': f"{dt.month}/{dt.day}",
             '星期': ['一', '二', '三', '四', '五', '六', '日'][dt.weekday()],
             '未填角色': ', '.join(roles),
-            '類型': '假日' if date_str in holidays else '平日'
+            '類型': '假日' if date_str in holiday_set else '平日'
         })
     
     df_unfilled = pd.DataFrame(unfilled_summary)
@@ -239,7 +241,7 @@ def render_unfilled_analysis(result):
         # 按類型統計
         type_counts = {'平日': 0, '假日': 0}
         for date_str, _ in result.unfilled_slots:
-            if date_str in holidays:
+            if date_str in holiday_set:
                 type_counts['假日'] += 1
             else:
                 type_counts['平日'] += 1
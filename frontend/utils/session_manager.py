@@ -5,7 +5,8 @@ Session狀態管理器 - 簡化版（移除演算法參數設定）
 import streamlit as st
 import json
 import os
-from datetime import datetime
+import re
+from datetime import datetime, date
 from typing import List, Set
 
 from backend.models import Doctor, ScheduleConstraints
@@ -218,6 +219,7 @@ class SessionManager:
             "constraints": {
                 "max_consecutive_days": st.session_state.constraints.max_consecutive_days,
                 "beam_width": st.session_state.constraints.beam_width,
+                "branching_factor": st.session_state.constraints.branching_factor,
                 "csp_timeout": st.session_state.constraints.csp_timeout,
                 "neighbor_expansion": st.session_state.constraints.neighbor_expansion,
             },
@@ -270,6 +272,7 @@ class SessionManager:
                 st.session_state.constraints = ScheduleConstraints(
                     max_consecutive_days=c.get("max_consecutive_days", 2),
                     beam_width=c.get("beam_width", 5),
+                    branching_factor=c.get("branching_factor", 3),
                     csp_timeout=c.get("csp_timeout", 10),
                     neighbor_expansion=c.get("neighbor_expansion", 10),
                 )
@@ -369,8 +372,6 @@ class SessionManager:
     @staticmethod
     def load_doctors() -> bool:
         """從獨立檔案載入醫師資料（修正版 - 正確處理年月）"""
-        import re
-
         doctors_file = "data/configs/doctors.json"
 
         # 嘗試不同的檔案位置
@@ -443,8 +444,6 @@ class SessionManager:
                         # 轉換為完整日期
                         if 1 <= day <= 31:
                             try:
-                                from datetime import date
-
                                 date_obj = date(year, month, day)
                                 processed_unavailable.append(
                                     date_obj.strftime("%Y-%m-%d")
@@ -472,8 +471,6 @@ class SessionManager:
                         # 轉換為完整日期
                         if 1 <= day <= 31:
                             try:
-                                from datetime import date
-
                                 date_obj = date(year, month, day)
                                 processed_preferred.append(
                                     date_obj.strftime("%Y-%m-%d")
@@ -0,0 +1,53 @@
+"""
+特徵提取器測試
+"""
+from backend.analyzers.feature_extractor import FeatureExtractor
+from backend.models import Doctor, ScheduleSlot
+
+
+def make_schedule(assignments):
+    """assignments: {date: (attending, resident)}"""
+    return {
+        date_str: ScheduleSlot(date=date_str, attending=attending, resident=resident)
+        for date_str, (attending, resident) in assignments.items()
+    }
+
+
+class TestConsecutiveDays:
+    """測試 _calculate_consecutive_days"""
+
+    doctors = [
+        Doctor(name="王醫師", role="主治", weekday_quota=5, holiday_quota=2),
+        Doctor(name="李醫師", role="總醫師", weekday_quota=5, holiday_quota=2),
+    ]
+
+    def test_streaks_per_doctor(self):
+        schedule = make_schedule({
+            "2025-09-01": ("王醫師", "李醫師"),
+            "2025-09-02": ("王醫師", None),
+            "2025-09-03": (None, "李醫師"),
+            "2025-09-04": ("王醫師", "李醫師"),
+            "2025-09-30": (None, None),
+        })
+        result = FeatureExtractor()._calculate_consecutive_days(schedule, self.doctors)
+        # 王醫師：9/1-9/2、9/4；李醫師：9/1、9/3-9/4
+        assert result == [2, 1, 1, 2]
+
+    def test_streak_across_month_boundary(self):
+        schedule = make_schedule({
+            "2025-08-31": ("王醫師", None),
+            "2025-09-01": ("王醫師", None),
+        })
+        result = FeatureExtractor()._calculate_consecutive_days(schedule, self.doctors[:1])
+        assert result == [2]
+
+    def test_non_date_keys_outside_roster_streaks_are_ignored(self):
+        # 非日期鍵只有名單外醫師或名單內醫師的單一值班，不需解析日期
+        schedule = make_schedule({
+            "2025-09-01": ("王醫師", None),
+            "2025-09-02": ("王醫師", None),
+            "備註": ("支援醫師", None),
+            "待定": (None, "李醫師"),
+        })
+        result = FeatureExtractor()._calculate_consecutive_days(schedule, self.doctors)
+        assert result == [2, 1]
@@ -0,0 +1,28 @@
+"""
+排班資料模型測試
+"""
+from dataclasses import fields
+
+from backend.models import ScheduleSlot, clone_schedule
+
+
+class TestScheduleClone:
+    """測試 ScheduleSlot.copy 與 clone_schedule"""
+
+    def test_slot_copy_keeps_every_field(self):
+        slot = ScheduleSlot(date="2025-09-01", attending="王醫師", resident="李醫師")
+        copied = slot.copy()
+        assert copied is not slot
+        for f in fields(ScheduleSlot):
+            assert getattr(copied, f.name) == getattr(slot, f.name)
+
+    def test_clone_schedule_is_independent(self):
+        schedule = {
+            "2025-09-01": ScheduleSlot(date="2025-09-01", attending="王醫師"),
+            "2025-09-02": ScheduleSlot(date="2025-09-02", resident="李醫師"),
+        }
+        cloned = clone_schedule(schedule)
+        assert cloned == schedule
+
+        cloned["2025-09-01"].resident = "陳醫師"
+        assert schedule["2025-09-01"].resident is None
@@ -0,0 +1,181 @@
+"""
+Stage 1 排班器測試
+涵蓋逐步加寬束寬的 Beam Search 時間控制與多行程平行展開
+"""
+import pickle
+import random
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from backend.algorithms import stage1_greedy_beam
+from backend.algorithms.stage1_greedy_beam import Stage1Scheduler
+from backend.models import Doctor, ScheduleConstraints, SchedulingState
+from backend.utils.calendar_utils import get_month_calendar
+
+
+def build_roster(seed: int = 7, num_doctors: int = 8, num_attending: int = 4,
+                 weekday_quota=(3, 6), holiday_quota=(1, 3)):
+    """建立固定亂數種子的小型醫師名單（2025 年 9 月）"""
+    weekdays, holidays = get_month_calendar(2025, 9)
+    dates = sorted(weekdays + holidays)
+    rng = random.Random(seed)
+    doctors = [
+        Doctor(
+            name=f"醫師{i}",
+            role="主治" if i < num_attending else "總醫師",
+            weekday_quota=rng.randint(*weekday_quota),
+            holiday_quota=rng.randint(*holiday_quota),
+            unavailable_dates=rng.sample(dates, rng.randint(0, 6)),
+            preferred_dates=rng.sample(dates, rng.randint(0, 2)),
+        )
+        for i in range(num_doctors)
+    ]
+    return doctors, weekdays, holidays
+
+
+def make_state(ids, score: float) -> SchedulingState:
+    """建立只含排班陣列與分數的狀態"""
+    arr = np.array(ids, dtype=np.int16)
+    return SchedulingState(
+        schedule=None, score=score, filled_count=0, unfilled_slots=[],
+        attending_ids=arr, resident_ids=arr.copy()
+    )
+
+
+class FakeClock:
+    """假時鐘：由模擬的 Beam Search 每輪推進固定秒數"""
+
+    def __init__(self, pass_seconds: float):
+        self.now = 0.0
+        self.pass_seconds = pass_seconds
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class TestIterativeBeamSearch:
+    """測試 _iterative_beam_search 的束寬序列、時間上限與去重"""
+
+    @pytest.fixture
+    def scheduler(self):
+        doctors, weekdays, holidays = build_roster()
+        return Stage1Scheduler(doctors, ScheduleConstraints(), weekdays, holidays)
+
+    def run_with_clock(self, scheduler, beam_width, time_budget_s, pass_seconds, results=None):
+        """以假時鐘執行，回傳 (各輪束寬, 各輪截止時間, 結果)"""
+        clock = FakeClock(pass_seconds)
+        widths, deadlines = [], []
+
+        def fake_pass(initial_states, width, progress_callback, max_workers, deadline=None):
+            widths.append(width)
+            deadlines.append(deadline)
+            clock.now += clock.pass_seconds
+            if results is not None:
+                return results(width)
+            return [make_state([width, 0], float(width))]
+
+        fake_time = SimpleNamespace(monotonic=clock.monotonic)
+        with patch.object(stage1_greedy_beam, 'time', fake_time), \
+             patch.object(scheduler, '_beam_search_optimization', side_effect=fake_pass):
+            states = scheduler._iterative_beam_search([], beam_width, None, 1, time_budget_s)
+        return widths, deadlines, states
+
+    def test_widths_double_up_to_beam_width(self, scheduler):
+        widths, deadlines, states = self.run_with_clock(scheduler, 5, 100.0, 1.0)
+        assert widths == [1, 2, 4, 5]
+        assert deadlines == [100.0] * 4
+        assert len(states) == 4
+
+    def test_power_of_two_beam_width_not_repeated(self, scheduler):
+        widths, _, _ = self.run_with_clock(scheduler, 8, 100.0, 1.0)
+        assert widths == [1, 2, 4, 8]
+
+    def test_stops_when_next_pass_would_exceed_budget(self, scheduler):
+        # 每輪 1 秒、上限 4.5 秒：第 3 輪結束於 3 秒，預估第 4 輪需 2 秒（至 5 秒）超過上限
+        widths, _, _ = self.run_with_clock(scheduler, 16, 4.5, 1.0)
+        assert widths == [1, 2, 4]
+
+    def test_first_pass_always_runs(self, scheduler):
+        widths, deadlines, states = self.run_with_clock(scheduler, 5, 0.5, 1.0)
+        assert widths == [1]
+        assert deadlines == [0.5]
+        assert len(states) == 1
+
+    def test_states_deduplicated_by_schedule(self, scheduler):
+        # 每輪都回傳相同排班（分數不同）與一個該輪獨有的排班
+        def results(width):
+            return [make_state([1, 2], float(width)), make_state([width, 9], 0.0)]
+
+        widths, _, states = self.run_with_clock(scheduler, 4, 100.0, 1.0, results)
+        assert widths == [1, 2, 4]
+        keys = [(s.attending_ids.tobytes(), s.resident_ids.tobytes()) for s in states]
+        assert len(keys) == len(set(keys)) == 4
+        shared = [s for s in states if s.attending_ids.tolist() == [1, 2]]
+        assert len(shared) == 1
+        assert shared[0].score == 4.0
+
+    def test_beam_search_stops_between_steps_after_deadline(self, scheduler):
+        initial_states = scheduler._greedy_initialization(2)
+        progress = []
+        scheduler._beam_search_optimization(
+            initial_states, 2, progress.append, deadline=float('-inf')
+        )
+        assert scheduler.diagnostic_info['beam_search_iterations'] > 1
+        assert len(progress) == 1
+
+
+def schedule_signature(states):
+    """以分數與排班內容比較結果"""
+    return [
+        (state.score, sorted((d, slot.attending, slot.resident) for d, slot in state.schedule.items()))
+        for state in states
+    ]
+
+
+class TestParallelBeamSearch:
+    """測試多行程展開（max_workers > 1）與單行程結果一致"""
+
+    @pytest.fixture
+    def roster(self):
+        # 配額偏緊，無完美解，必定進入 Beam Search
+        return build_roster(seed=2, num_doctors=6, num_attending=3,
+                            weekday_quota=(2, 5), holiday_quota=(1, 2))
+
+    def run_scheduler(self, roster, max_workers):
+        doctors, weekdays, holidays = roster
+        random.seed(0)
+        scheduler = Stage1Scheduler(doctors, ScheduleConstraints(), weekdays, holidays)
+        return scheduler, scheduler.run(beam_width=5, max_workers=max_workers)
+
+    def test_parallel_matches_serial_top5(self, roster):
+        serial_scheduler, serial = self.run_scheduler(roster, 1)
+        _, parallel = self.run_scheduler(roster, 2)
+        assert not serial_scheduler.diagnostic_info['perfect_solution']
+        assert serial_scheduler.diagnostic_info['beam_search_iterations'] > 0
+        assert len(serial) == 5
+        assert schedule_signature(parallel) == schedule_signature(serial)
+
+    def test_pickled_scheduler_expands_identically(self, roster):
+        # 子行程以 spawn/forkserver 啟動時排班器需經序列化，閉包須於還原時重建
+        doctors, weekdays, holidays = roster
+        scheduler = Stage1Scheduler(doctors, ScheduleConstraints(), weekdays, holidays)
+        scheduler.set_log_callback(lambda message, level: None)
+        random.seed(0)
+        state = scheduler._greedy_initialization(1)[0]
+        date_str, role = state.unfilled_slots[0]
+
+        restored = pickle.loads(pickle.dumps(scheduler))
+        assert restored.log_callback is None
+
+        expected = scheduler._expand_state(state, date_str, role)
+        actual = restored._expand_state(state, date_str, role)
+        assert [s.score for s in actual] == [s.score for s in expected]
+        assert [s.attending_ids.tolist() for s in actual] == [s.attending_ids.tolist() for s in expected]
+        assert [s.resident_ids.tolist() for s in actual] == [s.resident_ids.tolist() for s in expected]
+
+        for doctor in doctors:
+            args = (doctor.name, date_str, doctor.role, state.schedule, state.used_quota)
+            assert restored._check_assign(*args) == scheduler._check_assign(*args)
@@ -0,0 +1,107 @@
+"""
+Stage 2 交換補洞系統測試
+確認排班表經由 update_slot、apply_swap_chain 與回溯變動後，
+連續值班快取、班次索引、可交換班次快取與班數統計都與重新建立的系統一致
+"""
+from backend.algorithms.stage2_interactiveCSP import Stage2AdvancedSwapper, SwapChain, SwapStep
+from backend.models import Doctor, ScheduleConstraints, ScheduleSlot
+from backend.utils.calendar_utils import get_month_calendar
+
+
+ATTENDING = ["主治A", "主治B", "主治C"]
+RESIDENT = ["總醫師A", "總醫師B", "總醫師C"]
+
+
+def build_swapper() -> Stage2AdvancedSwapper:
+    """建立 2025 年 9 月的排班（輪流排班，部分日期留空）"""
+    weekdays, holidays = get_month_calendar(2025, 9)
+    dates = sorted(weekdays + holidays)
+    doctors = [
+        Doctor(name=name, role="主治", weekday_quota=8, holiday_quota=4,
+               preferred_dates=[dates[i]] if i == 0 else [])
+        for i, name in enumerate(ATTENDING)
+    ] + [
+        Doctor(name=name, role="總醫師", weekday_quota=8, holiday_quota=4)
+        for name in RESIDENT
+    ]
+    schedule = {}
+    for i, date_str in enumerate(dates):
+        schedule[date_str] = ScheduleSlot(
+            date=date_str,
+            attending=None if i % 7 == 3 else ATTENDING[(i // 2) % 3],
+            resident=None if i % 5 == 4 else RESIDENT[i % 3],
+        )
+    return Stage2AdvancedSwapper(
+        schedule, doctors, ScheduleConstraints(max_consecutive_days=2), weekdays, holidays
+    )
+
+
+def snapshot(swapper: Stage2AdvancedSwapper) -> dict:
+    """查詢所有會被快取的答案（同時讓快取填滿）"""
+    return {
+        'consecutive': {
+            (doctor.name, date_str): swapper._would_violate_consecutive(doctor.name, date_str)
+            for doctor in swapper.doctors for date_str in swapper.schedule
+        },
+        'shifts': {
+            doctor.name: swapper._get_doctor_shifts(doctor) for doctor in swapper.doctors
+        },
+        'swappable': {
+            (doctor.name, is_holiday): swapper._find_swappable_dates_for_doctor(doctor, is_holiday)
+            for doctor in swapper.doctors for is_holiday in (True, False)
+        },
+        'duties': {
+            name: dict(counts) for name, counts in swapper.current_duties.items() if counts['total']
+        },
+    }
+
+
+def fresh_snapshot(swapper: Stage2AdvancedSwapper) -> dict:
+    """以目前排班表重新建立系統並查詢（鎖定班次沿用原系統建立時的結果）"""
+    fresh = Stage2AdvancedSwapper(
+        swapper.schedule, swapper.doctors, swapper.constraints,
+        swapper.weekdays, swapper.holidays
+    )
+    fresh.locked_assignments = swapper.locked_assignments
+    return snapshot(fresh)
+
+
+class TestScheduleCaches:
+    """測試排班表變動後快取與增量統計不會過時"""
+
+    def test_edit_swap_and_undo_keep_caches_consistent(self):
+        swapper = build_swapper()
+        dates = list(swapper.schedule)
+        assert snapshot(swapper) == fresh_snapshot(swapper)
+
+        # 編輯：填入空缺並更換另一格
+        gap_date = dates[3]
+        assert swapper.schedule[gap_date].attending is None
+        swapper.update_slot(gap_date, "主治", "主治C")
+        swapper.update_slot(dates[1], "總醫師", "總醫師C")
+        before_swap = snapshot(swapper)
+        assert before_swap == fresh_snapshot(swapper)
+
+        # 交換：把主治A 的一個班移到空缺日
+        from_date = next(
+            d for d in dates[5:] if swapper.schedule[d].attending == "主治A"
+        )
+        to_date = next(d for d in dates[8:] if swapper.schedule[d].attending is None)
+        chain = SwapChain(steps=[
+            SwapStep(description="移動", from_date=from_date, to_date=to_date,
+                     doctor="主治A", role="主治")
+        ])
+        assert swapper.apply_swap_chain(chain)
+        assert swapper.schedule[from_date].attending is None
+        assert swapper.schedule[to_date].attending == "主治A"
+        after_swap = snapshot(swapper)
+        assert after_swap != before_swap
+        assert after_swap == fresh_snapshot(swapper)
+
+        # 回溯：恢復交換前的狀態
+        assert swapper._backtrack()
+        assert swapper.schedule[from_date].attending == "主治A"
+        assert swapper.schedule[to_date].attending is None
+        restored = snapshot(swapper)
+        assert restored == before_swap
+        assert restored == fresh_snapshot(swapper)